@@ -0,0 +1,29 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0019_fiscalyear_prefix'),
+        ('condominium', '0020_propertylot_maxvalue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OwnerBalance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner_type', models.IntegerField(default=0, verbose_name='owner account')),
+                ('journal_class', models.IntegerField(choices=[(0, 'last year report'), (1, 'payoff'), (2, 'other')], default=2, verbose_name='journal')),
+                ('amount', models.FloatField(default=0, verbose_name='amount')),
+                ('third', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounting.third', verbose_name='third')),
+                ('year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounting.fiscalyear', verbose_name='fiscal year')),
+            ],
+            options={
+                'verbose_name': 'owner balance',
+                'verbose_name_plural': 'owner balances',
+                'default_permissions': [],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CORE', '0007_shortcut'),
+        ('condominium', '0021_ownerbalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CallFundsJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('num', models.IntegerField(verbose_name='numeros')),
+                ('creation_date', models.DateTimeField(auto_now_add=True, verbose_name='creation date')),
+                ('status', models.IntegerField(choices=[(0, 'waiting'), (1, 'running'), (2, 'done'), (3, 'failure')], db_index=True, default=0, verbose_name='status')),
+                ('callfunds_list', models.TextField(default='', verbose_name='calls of funds')),
+                ('owner_list', models.TextField(default='', verbose_name='owners')),
+                ('progress', models.IntegerField(default=0, verbose_name='progress')),
+                ('error', models.TextField(default='', verbose_name='error')),
+                ('user', models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, to='CORE.lucteriosuser', verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'call of funds job',
+                'verbose_name_plural': 'call of funds jobs',
+                'ordering': ['-id'],
+                'default_permissions': [],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def clear_owner_balance(apps, schema_editor):
+    # rebuilt by the 'convertdata' signal after migration
+    apps.get_model('condominium', 'OwnerBalance').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0019_fiscalyear_prefix'),
+        ('condominium', '0022_callfundsjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_owner_balance, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='ownerbalance',
+            unique_together={('third', 'year', 'owner_type', 'journal_class')},
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('condominium', '0023_ownerbalance_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='callfundsjob',
+            name='claim_date',
+            field=models.DateTimeField(default=None, null=True, verbose_name='claim date'),
+        ),
+        migrations.AddField(
+            model_name='callfundsjob',
+            name='worker',
+            field=models.CharField(default='', max_length=100, verbose_name='worker'),
+        ),
+    ]
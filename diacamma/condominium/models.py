@@ -23,37 +23,52 @@ along with Lucterios.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
 from __future__ import unicode_literals
-from datetime import date
+from datetime import date, timedelta
+from os import getpid, kill
+from socket import gethostname
+from threading import local
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from re import search as re_search
 from logging import getLogger
 from decimal import Decimal
 
-from django.db import models
-from django.db.models import Q
-from django.db.models.aggregates import Sum, Max, Count
+from django import setup as django_setup
+from django.db import models, transaction, connections
+from django.db.models import Q, F, Func, OuterRef, Subquery, Value, Case, When, Prefetch
+from django.db.models.functions import Coalesce, Round
+from django.db.models.lookups import Exact
+from django.db.models.aggregates import Sum, Max, Min, Count
 from django.db.utils import IntegrityError
 from django.db.models.query import QuerySet
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.utils.translation import gettext_lazy as _
-from django.utils import formats
+from django.utils import formats, timezone
 from django.core.exceptions import ObjectDoesNotExist, FieldDoesNotExist
 from django.conf import settings
+from django.core.signals import request_started, request_finished
 from django_fsm import FSMIntegerField, transition
 
 from lucterios.framework.models import LucteriosModel, correct_db_field
-from lucterios.framework.model_fields import get_subfield_show, LucteriosVirtualField, LucteriosDecimalField
+from lucterios.framework.model_fields import get_subfield_show, LucteriosVirtualField, LucteriosDecimalField, LucteriosScheduler
 from lucterios.framework.error import LucteriosException, IMPORTANT, GRAVE
 from lucterios.framework.tools import convert_date, get_date_formating, format_to_string
 from lucterios.framework.signal_and_lock import Signal
-from lucterios.framework.auditlog import auditlog
-from lucterios.CORE.models import Parameter, LucteriosGroup
+from lucterios.framework.auditlog import auditlog, lct_log_create, lct_log_update, LucteriosAuditlogModelRegistry
+from lucterios.CORE.models import Parameter, LucteriosGroup, LucteriosUser
 from lucterios.CORE.parameters import Params
-from lucterios.contacts.models import AbstractContact, CustomField, CustomizeObject
+from lucterios.contacts.models import AbstractContact, Individual, LegalEntity, CustomField, CustomizeObject
+from lucterios.documents.models import DocumentContainer
 
 from diacamma.accounting.models import CostAccounting, EntryAccount, ChartsAccount, EntryLineAccount, FiscalYear, Budget, AccountThird, Third, Journal
 from diacamma.accounting.tools import currency_round, current_system_account, get_amount_sum, correct_accounting_code, format_with_devise
 from diacamma.accounting.tools_reports import get_spaces
 from diacamma.payoff.models import Supporting, Payoff, BankTransaction, DepositSlip
 from diacamma.condominium.system import current_system_condo
+from diacamma.condominium.tools import ventilate_amount
 
 DEFAULT_ACCOUNT_ALL = 0
 DEFAULT_ACCOUNT_CURRENT = 1
@@ -63,6 +78,56 @@ DEFAULT_ACCOUNT_LOAN = 4
 DEFAULT_ACCOUNT_FUNDOFWORK = 5
 LIST_DEFAULT_ACCOUNTS = (DEFAULT_ACCOUNT_CURRENT, DEFAULT_ACCOUNT_EXCEPTIONNEL, DEFAULT_ACCOUNT_ADVANCE, DEFAULT_ACCOUNT_LOAN, DEFAULT_ACCOUNT_FUNDOFWORK)
 
+VENTILATION_CONTEXT = local()
+IMPORT_CONTEXT = local()
+ACCOUNT_CONTEXT = local()
+
+
+def bulk_create_with_auditlog(model, items):
+    if not auditlog.contains(model) or not LucteriosAuditlogModelRegistry.get_state(model._meta.app_label):
+        return model.objects.bulk_create(items)
+    if not connections[model.objects.db].features.can_return_rows_from_bulk_insert:
+        for item in items:
+            item.save()
+        return items
+    items = model.objects.bulk_create(items)
+    for item in items:
+        lct_log_create(model, item, created=True)
+    return items
+
+
+def bulk_update_with_auditlog(model, items, fields):
+    if auditlog.contains(model) and LucteriosAuditlogModelRegistry.get_state(model._meta.app_label):
+        for item in items:
+            lct_log_update(model, item)
+    return model.objects.bulk_update(items, fields)
+
+
+class SetQuerySet(QuerySet):
+
+    def with_sum_values(self, begin_date, end_date):
+        expense_lines = EntryLineAccount.objects.filter(Set.get_expense_filter(begin_date, end_date) & Q(costaccounting__setcost__set=OuterRef('pk')))
+        load_ratio = RecoverableLoadRatio.objects.filter(code=OuterRef('account__code')).order_by().values('ratio')[:1]
+        expense_sum = expense_lines.order_by().values('costaccounting__setcost__set').annotate(sum=Sum('amount')).values('sum')
+        recovery_load_sum = expense_lines.annotate(load_ratio=Subquery(load_ratio)).order_by().values('costaccounting__setcost__set').annotate(sum=Sum(F('amount') * F('load_ratio'), output_field=models.FloatField())).values('sum')
+        return self.annotate(sum_values_begin=Value(begin_date, output_field=models.DateField()), sum_values_end=Value(end_date, output_field=models.DateField()),
+                             expense_sum_value=Subquery(expense_sum), recovery_load_sum_value=Subquery(recovery_load_sum))
+
+    def with_financials(self, begin_date, end_date):
+        current_year = FiscalYear.get_current()
+        budget_cases = []
+        for type_load, account, setcost_filter in ((Set.TYPELOAD_CURRENT, Params.getvalue("condominium-current-revenue-account"), Q(year=current_year)),
+                                                   (Set.TYPELOAD_EXCEPTIONAL, Params.getvalue("condominium-exceptional-revenue-account"), Q())):
+            nb_costs = SetCost.objects.filter(setcost_filter & Q(set=OuterRef('pk'))).order_by().values('set').annotate(nb=Count('id')).values('nb')
+            budget = Budget.objects.filter(Q(code=account) & Q(cost_accounting__setcost__set=OuterRef('pk')))
+            if type_load == Set.TYPELOAD_CURRENT:
+                budget = budget.filter(cost_accounting__setcost__year=current_year)
+            budget = budget.order_by().values('cost_accounting__setcost__set').annotate(sum=Sum('amount')).values('sum')
+            budget_cases.append(When(Exact(Subquery(nb_costs), 1), type_load=type_load, then=Coalesce(Subquery(budget), Value(0.0))))
+        total_part = QuerySet(model=Partition).filter(set_id=OuterRef('pk')).order_by().values('set_id').annotate(sum=Sum('value')).values('sum')
+        return self.with_sum_values(begin_date, end_date).annotate(budget_value=Case(*budget_cases, default=Value(0.0), output_field=models.FloatField()),
+                                                                   total_part_value=Subquery(total_part))
+
 
 class Set(LucteriosModel):
     TYPELOAD_CURRENT = 0
@@ -89,6 +154,8 @@ class Set(LucteriosModel):
     # for legacy
     sumexpense_txt = LucteriosVirtualField(verbose_name=_('expense'), compute_from='get_sumexpense', format_string=lambda: format_with_devise(5))
 
+    objects = SetQuerySet.as_manager()
+
     def __init__(self, *args, **kwargs):
         LucteriosModel.__init__(self, *args, **kwargs)
         self.date_begin = None
@@ -96,6 +163,7 @@ class Set(LucteriosModel):
         self.is_compute_sum_values = False
         self.expense_sum = 0.0
         self.recovery_load_sum = 0.0
+        self.total_part_value = None
 
     def set_dates(self, begin_date=None, end_date=None):
         if begin_date is None:
@@ -124,16 +192,16 @@ class Set(LucteriosModel):
     def partitionNoEmpty_set(self):
         if self.id is None:
             return Partition.objects.filter(set=None)
-        return self.partition_set.filter(Q(value__gt=0.001))
+        return self.partition_set.filter(Q(value__gt=0.001)).with_total_part()
 
     @property
     def partitionfill_set(self):
         if self.id is None:
             return Partition.objects.filter(set=None)
         if self.is_link_to_lots:
-            return self.partition_set.filter(Q(value__gt=0.001))
+            return self.partition_set.filter(Q(value__gt=0.001)).with_total_part()
         else:
-            return self.partition_set.filter(Q(owner__third__status=Third.STATUS_ENABLE))
+            return self.partition_set.filter(Q(owner__third__status=Third.STATUS_ENABLE)).with_total_part()
 
     def get_identify(self):
         if self.id is None:
@@ -164,9 +232,8 @@ class Set(LucteriosModel):
         new_ids = LucteriosModel._do_insert(self, manager, using, fields, update_pk, raw)
         if isinstance(new_ids, int):
             new_ids = [new_ids]
-        for owner in Owner.objects.filter(third__status=Third.STATUS_ENABLE):
-            for new_id in new_ids:
-                Partition.objects.create(set_id=new_id[0] if isinstance(new_id, tuple) else new_id, owner=owner)
+        Partition.provide([new_id[0] if isinstance(new_id, tuple) else new_id for new_id in new_ids],
+                          Owner.objects.filter(third__status=Third.STATUS_ENABLE).values_list('id', flat=True))
         return new_ids
 
     def get_current_cost_accounting(self):
@@ -290,6 +357,8 @@ class Set(LucteriosModel):
     def get_current_budget(self):
         if self.id is None:
             return None
+        if hasattr(self, 'budget_value'):
+            return self.budget_value
         if self.type_load == self.TYPELOAD_EXCEPTIONAL:
             account = Params.getvalue("condominium-exceptional-revenue-account")
             costs = self.setcost_set.all()
@@ -340,29 +409,34 @@ class Set(LucteriosModel):
     def get_total_part(self):
         if self.id is None:
             return None
-        total = self.partition_set.all().aggregate(sum=Sum('value'))
-        if 'sum' in total.keys():
-            res = total['sum']
-        else:
-            res = Decimal(0.0)
-        return res
+        if self.total_part_value is None:
+            total = self.partition_set.all().aggregate(sum=Sum('value'))
+            if 'sum' in total.keys():
+                self.total_part_value = total['sum']
+            else:
+                self.total_part_value = Decimal(0.0)
+        return self.total_part_value
+
+    def clear_total_part(self):
+        self.total_part_value = None
+
+    @classmethod
+    def get_expense_filter(cls, begin_date, end_date):
+        entryline_filter = Q(account__type_of_account=ChartsAccount.TYPE_EXPENSE)
+        entryline_filter &= Q(entry__date_value__gte=begin_date) & Q(entry__date_value__lte=end_date)
+        return entryline_filter
 
     def compute_sum_values(self):
         if not self.is_compute_sum_values:
             self.is_compute_sum_values = True
-            self.expense_sum = 0.0
-            self.recovery_load_sum = 0.0
             if self.date_begin is None:
                 self.set_dates()
-            entryline_filter = Q(account__type_of_account=ChartsAccount.TYPE_EXPENSE)
-            entryline_filter &= Q(entry__date_value__gte=self.date_begin) & Q(entry__date_value__lte=self.date_end)
-            entryline_filter &= Q(costaccounting__setcost__set=self)
-            for entry in EntryLineAccount.objects.filter(entryline_filter).distinct():
-                recovery_load_ratio = RecoverableLoadRatio.objects.filter(code=entry.account.code).first()
-                self.expense_sum += float(entry.amount)
-                if recovery_load_ratio is not None:
-                    load_ratio = recovery_load_ratio.ratio
-                    self.recovery_load_sum += float(entry.amount) * float(load_ratio) / 100.0
+            if (getattr(self, 'sum_values_begin', None) == self.date_begin) and (getattr(self, 'sum_values_end', None) == self.date_end):
+                sum_values = {'expense_sum_value': self.expense_sum_value, 'recovery_load_sum_value': self.recovery_load_sum_value}
+            else:
+                sum_values = Set.objects.filter(id=self.id).with_sum_values(self.date_begin, self.date_end).values('expense_sum_value', 'recovery_load_sum_value')[0]
+            self.expense_sum = float(sum_values['expense_sum_value'] or 0.0)
+            self.recovery_load_sum = float(sum_values['recovery_load_sum_value'] or 0.0) / 100.0
 
     def get_sumexpense(self):
         if self.id is None:
@@ -370,16 +444,33 @@ class Set(LucteriosModel):
         self.compute_sum_values()
         return self.expense_sum
 
-    def refresh_ratio_link_lots(self):
+    def refresh_ratio_link_lots(self, owner_ids=None):
         if self.id is None:
             return
         if self.is_link_to_lots:
-            for part in self.partition_set.all():
-                value = 0
-                for property_lot in self.set_of_lots.all().filter(owner=part.owner):
-                    value += property_lot.get_value_by_key(self.secondarykey)
-                part.value = value
-                part.save()
+            partitions = self.partition_set.all()
+            if self.secondarykey_id is None:
+                lot_values = self.set_of_lots.all()
+                owner_field = 'owner_id'
+            else:
+                lot_values = PropertyLotCustomField.objects.filter(field_id=self.secondarykey_id, property__in=self.set_of_lots.all())
+                owner_field = 'property__owner_id'
+            if owner_ids is not None:
+                partitions = partitions.filter(owner_id__in=owner_ids)
+                lot_values = lot_values.filter(**{owner_field + '__in': owner_ids})
+            values = {}
+            for owner_id, value_sum in lot_values.order_by().values(owner_field).annotate(value_sum=Sum('value')).values_list(owner_field, 'value_sum'):
+                values[owner_id] = value_sum if value_sum is not None else 0
+            changed_partitions = []
+            for part in partitions:
+                value = values.get(part.owner_id, 0)
+                if part.value != value:
+                    part.value = value
+                    changed_partitions.append(part)
+            bulk_update_with_auditlog(Partition, changed_partitions, ['value'])
+            for part in changed_partitions:
+                Partition.delete_cache_text(part.id)
+            self.clear_total_part()
 
     def check_close(self):
         if self.id is None:
@@ -414,10 +505,7 @@ class Set(LucteriosModel):
         self.save()
 
     def get_total_calloffund(self, year):
-        value = 0
-        for calldetail in CallDetail.objects.filter(set=self, callfunds__date__gte=year.begin, callfunds__date__lte=year.end):
-            value += currency_round(calldetail.price)
-        return value
+        return CallDetail.get_total_price(Q(set=self) & Q(callfunds__date__gte=year.begin) & Q(callfunds__date__lte=year.end))
 
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
         if self.id is not None:
@@ -528,9 +616,6 @@ class LoadCountSet(QuerySet):
 
         self.partition_query = Q(owner=self.owner) & Q(value__gt=0)
         self.partition_query &= Q(set__setcost__cost_accounting__entrylineaccount__entry__date_value__gte=self.owner.date_begin) & Q(set__setcost__cost_accounting__entrylineaccount__entry__date_value__lte=self.owner.date_end)
-        self.account_query = Q(type_of_account=4)
-        self.account_query &= Q(entrylineaccount__entry__date_value__gte=self.owner.date_begin) & Q(entrylineaccount__entry__date_value__lte=self.owner.date_end)
-        self.account_query &= Q(entrylineaccount__costaccounting__setcost__set__partition__owner=self.owner) & Q(entrylineaccount__costaccounting__setcost__set__partition__value__gt=0)
         self.line_query = Q(entry__date_value__gte=self.owner.date_begin) & Q(entry__date_value__lte=self.owner.date_end)
 
         self.general_total = 0
@@ -553,22 +638,17 @@ class LoadCountSet(QuerySet):
         self._result_cache[result_cache_id] = LoadCount(id=pt_id, designation=designation, total=total, ratio=ratio,
                                                         ventilated=ventilated, recoverable_load=recoverable_load)
 
-    def fill_account(self, partition_item, account, ratio):
-        recovery_load_ratio = RecoverableLoadRatio.objects.filter(code=account.code)
-        if len(recovery_load_ratio) > 0:
-            load_ratio = float(recovery_load_ratio[0].ratio) / 100.0
-        else:
-            load_ratio = 0
+    def fill_account(self, partition_item, account, entry_lines, ratio, load_ratio):
         total = 0
         designation = get_spaces(8) + "{[b]}%s{[/b]}" % account
         code_ident = self.fill_title(designation)
-        for entry_line in EntryLineAccount.objects.filter(self.line_query & Q(account=account) & Q(costaccounting__setcost__set__partition=partition_item)).distinct().order_by('entry__date_value'):
+        for entry_line in entry_lines:
             designation = get_spaces(15) + "{[i]}%s{[/i]} - %s" % (get_date_formating(entry_line.entry.date_value), entry_line.entry.designation.replace('{[br/]}', ' - '))
             self.fill_title(designation, total=entry_line.amount)
             total += entry_line.amount
         self.change_value(code_ident,
                           total={'format': "{[b]}{0}{[/b]}", 'value': total},
-                          ratio={'format': "{[b]}{0}{[/b]}", 'value': "%d/%d" % (partition_item.value, partition_item.set.total_part)},
+                          ratio={'format': "{[b]}{0}{[/b]}", 'value': "%d/%d" % (partition_item.value, partition_item.set_total_part)},
                           ventilated={'format': "{[b]}{0}{[/b]}", 'value': total * ratio},
                           recoverable_load={'format': "{[b]}{0}{[/b]}", 'value': total * ratio * load_ratio})
         self.partition_general_total += total
@@ -576,28 +656,43 @@ class LoadCountSet(QuerySet):
         self.partition_recoverable_load_total += total * ratio * load_ratio
         self.fill_title('')
 
-    def fill_partition(self, partition_item):
-        ratio = float(partition_item.value / partition_item.set.total_part)
+    def fill_partition(self, partition_item, accounts, load_ratios):
+        ratio = float(partition_item.value / partition_item.set_total_part)
         partition_description = "{[i]}%s{[/i]}" % partition_item.set
         self.partition_general_total = 0
         self.partition_ventilated_total = 0
         self.partition_recoverable_load_total = 0
         partition_ident = None
-        for account in ChartsAccount.objects.filter(self.account_query & Q(entrylineaccount__costaccounting__setcost__set__partition=partition_item)).order_by('code').distinct():
+        for account, entry_lines in accounts:
             if partition_description != '':
                 partition_ident = self.fill_title(partition_description)
                 partition_description = ''
-            self.fill_account(partition_item, account, ratio)
+            self.fill_account(partition_item, account, entry_lines, ratio, load_ratios.get(account.code, 0))
         if partition_ident is not None:
             self.change_value(partition_ident,
                               total={'format': "{[i]}{0}{[/i]}", 'value': self.partition_general_total},
-                              ratio={'format': "{[i]}{0}{[/i]}", 'value': "%d/%d" % (partition_item.value, partition_item.set.total_part)},
+                              ratio={'format': "{[i]}{0}{[/i]}", 'value': "%d/%d" % (partition_item.value, partition_item.set_total_part)},
                               ventilated={'format': "{[i]}{0}{[/i]}", 'value': self.partition_ventilated_total},
                               recoverable_load={'format': "{[i]}{0}{[/i]}", 'value': self.partition_recoverable_load_total})
         self.general_total += self.partition_general_total
         self.ventilated_total += self.partition_ventilated_total
         self.recoverable_load_total += self.partition_recoverable_load_total
 
+    def get_accounts_by_set(self, set_ids):
+        accounts_by_set = {}
+        line_ids_by_set = {}
+        entry_lines = EntryLineAccount.objects.filter(self.line_query & Q(account__type_of_account=4) & Q(costaccounting__setcost__set_id__in=set_ids))
+        entry_lines = entry_lines.annotate(load_set_id=F('costaccounting__setcost__set_id')).select_related('entry', 'account').order_by('account__code', 'entry__date_value', 'id')
+        for entry_line in entry_lines:
+            if entry_line.id in line_ids_by_set.setdefault(entry_line.load_set_id, set()):
+                continue
+            line_ids_by_set[entry_line.load_set_id].add(entry_line.id)
+            accounts = accounts_by_set.setdefault(entry_line.load_set_id, [])
+            if (len(accounts) == 0) or (accounts[-1][0].id != entry_line.account_id):
+                accounts.append((entry_line.account, []))
+            accounts[-1][1].append(entry_line)
+        return accounts_by_set
+
     def _fetch_all(self):
         if self._result_cache is None:
             self._result_cache = []
@@ -605,14 +700,35 @@ class LoadCountSet(QuerySet):
             self.general_total = 0
             self.ventilated_total = 0
             self.recoverable_load_total = 0
-            for partition_item in Partition.objects.filter(self.partition_query).distinct():
-                self.fill_partition(partition_item)
+            partitions = list(Partition.objects.filter(self.partition_query).select_related('set').distinct().with_total_part())
+            accounts_by_set = self.get_accounts_by_set([partition_item.set_id for partition_item in partitions])
+            load_ratios = {}
+            for code, ratio in RecoverableLoadRatio.objects.values_list('code', 'ratio'):
+                load_ratios.setdefault(code, float(ratio) / 100.0)
+            for partition_item in partitions:
+                self.fill_partition(partition_item, accounts_by_set.get(partition_item.set_id, []), load_ratios)
             self.fill_title('',
                             total={'format': "{[u]}{0}{[/u]}", 'value': self.general_total},
                             ventilated={'format': "{[u]}{0}{[/u]}", 'value': self.ventilated_total},
                             recoverable_load={'format': "{[u]}{0}{[/u]}", 'value': self.recoverable_load_total})
 
 
+class PartitionQuerySet(QuerySet):
+
+    def with_total_part(self):
+        total_part = QuerySet(model=Partition).filter(set_id=OuterRef('set_id')).order_by().values('set_id').annotate(sum=Sum('value')).values('sum')
+        return self.annotate(set_total_part=Subquery(total_part))
+
+    def with_callfunds(self, begin_date, end_date):
+        calldetails = CallDetail.objects.filter(Q(callfunds__owner_id=OuterRef('owner_id')) & Q(set_id=OuterRef('set_id')) & Q(callfunds__date__gte=begin_date) & Q(callfunds__date__lte=end_date))
+        callfunds_sum = calldetails.order_by().values('set_id').annotate(sum=CallDetail.get_price_sum()).values('sum')
+        sum_values = Set.objects.filter(id=OuterRef('set_id')).with_sum_values(begin_date, end_date)
+        return self.annotate(callfunds_begin=Value(begin_date, output_field=models.DateField()), callfunds_end=Value(end_date, output_field=models.DateField()),
+                             callfunds_value=Subquery(callfunds_sum),
+                             set_expense_sum_value=Subquery(sum_values.values('expense_sum_value')),
+                             set_recovery_load_sum_value=Subquery(sum_values.values('recovery_load_sum_value')))
+
+
 class Partition(LucteriosModel):
     set = models.ForeignKey(Set, verbose_name=_('set'), null=False, db_index=True, on_delete=models.CASCADE)
     owner = models.ForeignKey('condominium.Owner', verbose_name=_('owner'), null=False, db_index=True, on_delete=models.CASCADE)
@@ -629,6 +745,8 @@ class Partition(LucteriosModel):
     ventilated_txt = LucteriosVirtualField(verbose_name=_('ventilated'), compute_from='get_ventilated', format_string=lambda: format_with_devise(5))
     recovery_load_txt = LucteriosVirtualField(verbose_name=_('recoverable load'), compute_from='get_recovery_load', format_string=lambda: format_with_devise(5))
 
+    objects = PartitionQuerySet.as_manager()
+
     def __init__(self, *args, **kwargs):
         LucteriosModel.__init__(self, *args, **kwargs)
         self.is_compute_values = False
@@ -650,10 +768,22 @@ class Partition(LucteriosModel):
     def get_import_fields(cls):
         return ["owner", "value"]
 
+    @classmethod
+    def provide(cls, set_ids, owner_ids):
+        set_ids = list(set_ids)
+        owner_ids = list(owner_ids)
+        if (len(set_ids) == 0) or (len(owner_ids) == 0):
+            return []
+        existing = set(cls.objects.filter(set_id__in=set_ids, owner_id__in=owner_ids).values_list('set_id', 'owner_id'))
+        new_partitions = [cls(set_id=set_id, owner_id=owner_id) for set_id in set_ids for owner_id in owner_ids if (set_id, owner_id) not in existing]
+        return bulk_create_with_auditlog(cls, new_partitions)
+
     def get_ratio(self):
         if self.id is None:
             return 0.0
-        total = self.set.total_part
+        total = getattr(self, 'set_total_part', None)
+        if total is None:
+            total = self.set.total_part
         if abs(total) < 0.01:
             return 0.0
         else:
@@ -663,14 +793,25 @@ class Partition(LucteriosModel):
         if xfer is not None:
             self.set.set_dates(xfer.getparam("begin_date"), xfer.getparam("end_date"))
 
+    def _has_callfunds_values(self):
+        if self.set.date_begin is None:
+            self.set.set_dates()
+        return (getattr(self, 'callfunds_begin', None) == self.set.date_begin) and (getattr(self, 'callfunds_end', None) == self.set.date_end)
+
     def compute_values(self):
         if not self.is_compute_values:
             self.is_compute_values = True
             ratio = self.get_ratio()
             if abs(ratio) > 0.01:
-                self.set.compute_sum_values()
-                self.ventilated_value = self.set.expense_sum * ratio / 100.0
-                self.recovery_load_value = self.set.recovery_load_sum * ratio / 100.0
+                if self._has_callfunds_values():
+                    expense_sum = float(self.set_expense_sum_value or 0.0)
+                    recovery_load_sum = float(self.set_recovery_load_sum_value or 0.0) / 100.0
+                else:
+                    self.set.compute_sum_values()
+                    expense_sum = self.set.expense_sum
+                    recovery_load_sum = self.set.recovery_load_sum
+                self.ventilated_value = expense_sum * ratio / 100.0
+                self.recovery_load_value = recovery_load_sum * ratio / 100.0
             else:
                 self.ventilated_value = 0.0
                 self.recovery_load_value = 0.0
@@ -690,18 +831,34 @@ class Partition(LucteriosModel):
     def get_callfunds(self):
         if (self.id is None) or (self.set is None) or (self.set.date_begin is None) or (self.set.date_end is None):
             return 0
-        value = 0
         ratio = self.get_ratio()
-        if abs(ratio) > 0.01:
-            for calldetail in CallDetail.objects.filter(callfunds__owner=self.owner, set=self.set, callfunds__date__gte=self.set.date_begin, callfunds__date__lte=self.set.date_end).distinct():
-                value += currency_round(calldetail.price)
-        return value
+        if abs(ratio) <= 0.01:
+            return 0
+        if self._has_callfunds_values():
+            return currency_round(self.callfunds_value) if self.callfunds_value is not None else 0
+        return CallDetail.get_total_price(Q(callfunds__owner_id=self.owner_id) & Q(set_id=self.set_id) & Q(callfunds__date__gte=self.set.date_begin) & Q(callfunds__date__lte=self.set.date_end))
 
     def get_total_current_regularization(self):
         if self.id is None:
             return None
         return currency_round(self.get_callfunds() - self.get_ventilated())
 
+    def clear_total_part(self):
+        if hasattr(self, 'set_total_part'):
+            del self.set_total_part
+        if Partition.set.is_cached(self):
+            self.set.clear_total_part()
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        res = LucteriosModel.save(self, force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
+        self.clear_total_part()
+        return res
+
+    def delete(self, using=None):
+        res = LucteriosModel.delete(self, using=using)
+        self.clear_total_part()
+        return res
+
     class Meta(object):
         verbose_name = _("division")
         verbose_name_plural = _("divisions")
@@ -813,7 +970,9 @@ class PropertyLotCustomField(LucteriosModel):
             return 0
 
     def get_ratio(self):
-        total = self.get_total_part(self.field)
+        total = getattr(self, 'field_total_part', None)
+        if total is None:
+            total = self.get_total_part(self.field_id)
         if abs(total) < 0.01:
             return 0.0
         else:
@@ -831,6 +990,14 @@ class PropertyLotCustomField(LucteriosModel):
         default_permissions = []
 
 
+class PropertyLotQuerySet(QuerySet):
+
+    def with_ratios(self):
+        lot_total = QuerySet(model=PropertyLot).order_by().values(sum=Func(F('value'), function='SUM'))
+        field_total = QuerySet(model=PropertyLotCustomField).filter(field_id=OuterRef('field_id')).order_by().values('field_id').annotate(sum=Sum('value')).values('sum')
+        return self.annotate(total_part_value=Coalesce(Subquery(lot_total), 0)).prefetch_related(Prefetch('propertylotcustomfield_set', queryset=PropertyLotCustomField.objects.annotate(field_total_part=Coalesce(Subquery(field_total), 0))))
+
+
 class PropertyLot(LucteriosModel, CustomizeObject):
     CustomFieldClass = PropertyLotCustomField
     FieldName = 'property'
@@ -843,6 +1010,8 @@ class PropertyLot(LucteriosModel, CustomizeObject):
     ratio = LucteriosVirtualField(verbose_name=_("general ratio"), compute_from='get_ratio', format_string='N1;{0} %')
     value_ratio = LucteriosVirtualField(verbose_name=_("general tantime"), compute_from='get_value_ratio')
 
+    objects = PropertyLotQuerySet.as_manager()
+
     def __init__(self, *args, **kwargs):
         LucteriosModel.__init__(self, *args, **kwargs)
         CustomizeObject.__init__(self)
@@ -878,25 +1047,48 @@ class PropertyLot(LucteriosModel, CustomizeObject):
         else:
             return 0
 
+    @classmethod
+    def get_owner_index(cls):
+        if getattr(IMPORT_CONTEXT, 'owner_index', None) is None:
+            contact_names = {}
+            for contact_id in AbstractContact.objects.values_list('id', flat=True):
+                contact_names[contact_id] = "contact#%d" % contact_id
+            for contact_id, lastname, firstname in Individual.objects.values_list('id', 'lastname', 'firstname'):
+                contact_names[contact_id] = '%s %s' % (lastname, firstname)
+            for contact_id, name in LegalEntity.objects.values_list('id', 'name'):
+                contact_names[contact_id] = name
+            third_names = {}
+            owner_index = {'owner': {}, 'third': {}, 'contact': {}}
+            for contact_id, name in contact_names.items():
+                owner_index['contact'].setdefault(name, contact_id)
+            for third_id, contact_id in Third.objects.values_list('id', 'contact_id'):
+                third_names[third_id] = contact_names.get(contact_id, '')
+                owner_index['third'].setdefault(third_names[third_id], third_id)
+            for owner in Owner.objects.all():
+                owner_index['owner'].setdefault(third_names.get(owner.third_id, ''), owner)
+            if not cls.is_import_mode():
+                return owner_index
+            IMPORT_CONTEXT.owner_index = owner_index
+        return IMPORT_CONTEXT.owner_index
+
     @classmethod
     def _convert_field_foreignkey(cls, fieldvalue, dep_field, fieldname, **_args):
-        def find_item(model, expectecvalue):
-            for item in model.objects.all():
-                if str(item.get_final_child()) == str(expectecvalue):
-                    return item
-            return None
         if fieldname == 'owner':
-            new_owner = find_item(Owner, fieldvalue)
+            owner_index = cls.get_owner_index()
+            owner_name = str(fieldvalue)
+            new_owner = owner_index['owner'].get(owner_name)
             if new_owner is None:
-                new_third = find_item(Third, fieldvalue)
-                if new_third is None:
-                    new_contact = find_item(AbstractContact, fieldvalue)
-                    if new_contact is not None:
-                        new_third = Third.objects.create(contact=new_contact, status=Third.STATUS_ENABLE)
-                if new_third is not None:
-                    new_owner = Owner.objects.create(third=new_third)
+                third_id = owner_index['third'].get(owner_name)
+                if third_id is None:
+                    contact_id = owner_index['contact'].get(owner_name)
+                    if contact_id is not None:
+                        third_id = Third.objects.create(contact_id=contact_id, status=Third.STATUS_ENABLE).id
+                        owner_index['third'][owner_name] = third_id
+                if third_id is not None:
+                    new_owner = Owner.objects.create(third_id=third_id)
                     new_owner.check_account()
                     new_owner.save()
+                    owner_index['owner'][owner_name] = new_owner
             if new_owner is None:
                 base_dep_field = cls.get_field_by_name('owner')
                 raise LucteriosException(GRAVE, _("%(name)s '%(value)s' unknown !") % {'name': base_dep_field.verbose_name, 'value': fieldvalue})
@@ -904,6 +1096,23 @@ class PropertyLot(LucteriosModel, CustomizeObject):
         else:
             return super(PropertyLot, cls)._convert_field_foreignkey(fieldvalue, dep_field, fieldname, **_args)
 
+    @classmethod
+    def is_import_mode(cls):
+        return getattr(IMPORT_CONTEXT, 'owner_ids', None) is not None
+
+    @classmethod
+    def initialize_import(cls):
+        super(PropertyLot, cls).initialize_import()
+        IMPORT_CONTEXT.owner_ids = set()
+        IMPORT_CONTEXT.custom_values = {}
+        IMPORT_CONTEXT.owner_index = None
+
+    @classmethod
+    def clear_import(cls):
+        IMPORT_CONTEXT.owner_ids = None
+        IMPORT_CONTEXT.custom_values = None
+        IMPORT_CONTEXT.owner_index = None
+
     @classmethod
     def import_data(cls, rowdata, dateformat):
         try:
@@ -916,12 +1125,46 @@ class PropertyLot(LucteriosModel, CustomizeObject):
             getLogger('diacamma.condominium').exception("import_data")
             return None
 
+    @classmethod
+    def _save_imported_custom_values(cls):
+        existing_values = {}
+        for ccf_model in PropertyLotCustomField.objects.filter(property_id__in=list(IMPORT_CONTEXT.custom_values.keys())):
+            existing_values[(ccf_model.property_id, ccf_model.field_id)] = ccf_model
+        new_values = []
+        changed_values = []
+        for lot_id, custom_values in IMPORT_CONTEXT.custom_values.items():
+            for field_id, value in custom_values.items():
+                ccf_model = existing_values.get((lot_id, field_id))
+                if ccf_model is None:
+                    new_values.append(PropertyLotCustomField(property_id=lot_id, field_id=field_id, value=value))
+                elif ccf_model.value != value:
+                    ccf_model.value = value
+                    changed_values.append(ccf_model)
+        PropertyLotCustomField.objects.bulk_create(new_values)
+        PropertyLotCustomField.objects.bulk_update(changed_values, ['value'])
+
+    @classmethod
+    def finalize_import(cls):
+        if cls.is_import_mode():
+            try:
+                with transaction.atomic():
+                    cls._save_imported_custom_values()
+                    lot_ids = list(IMPORT_CONTEXT.custom_values.keys())
+                    owner_ids = list(IMPORT_CONTEXT.owner_ids)
+                    for set_linked in Set.objects.filter(is_link_to_lots=True, set_of_lots__in=lot_ids).distinct():
+                        set_linked.refresh_ratio_link_lots(owner_ids)
+            finally:
+                cls.clear_import()
+        return None
+
     @property
     def owner_query(self):
         return Owner.objects.filter(third__status=Third.STATUS_ENABLE)
 
     def get_ratio(self):
-        total = self.get_total_part()
+        total = getattr(self, 'total_part_value', None)
+        if total is None:
+            total = self.get_total_part()
         if abs(total) < 0.01:
             return 0.0
         else:
@@ -940,24 +1183,57 @@ class PropertyLot(LucteriosModel, CustomizeObject):
             secondary_key = self._get_custom_for_attr(customField)
             return self._convert_value_for_attr(customField, secondary_key.value)
 
+    def _get_custom_for_attr(self, cf_model):
+        if 'propertylotcustomfield_set' in getattr(self, '_prefetched_objects_cache', {}):
+            ccf_models = [ccf_model for ccf_model in self.propertylotcustomfield_set.all() if ccf_model.field_id == cf_model.id]
+            if len(ccf_models) == 1:
+                return ccf_models[0]
+        return CustomizeObject._get_custom_for_attr(self, cf_model)
+
     def _convert_model_for_attr(self, cf_model, ccf_model):
         if hasattr(self, 'mother'):
             return CustomizeObject._convert_model_for_attr(self, cf_model, ccf_model)
         else:
             return ccf_model.get_data()
 
-    def refresh_set_ratio(self):
-        for set_linked in Set.objects.filter(is_link_to_lots=True):
-            if self in set_linked.set_of_lots.all():
-                set_linked.refresh_ratio_link_lots()
+    def refresh_set_ratio(self, owner_ids=None):
+        if owner_ids is None:
+            owner_ids = [self.owner_id]
+        for set_linked in Set.objects.filter(is_link_to_lots=True, set_of_lots=self).distinct():
+            set_linked.refresh_ratio_link_lots(owner_ids)
+
+    def _store_import_custom_values(self, params):
+        custom_values = IMPORT_CONTEXT.custom_values.setdefault(self.id, {})
+        for cf_name, cf_model in CustomField.get_fields(self.__class__):
+            if cf_name in params.keys():
+                args = cf_model.get_args()['list']
+                try:
+                    cf_value = self._convert_value_for_attr(cf_model, params[cf_name], args)
+                except Exception:
+                    cf_value = params[cf_name]
+                try:
+                    custom_values[cf_model.id] = int(float(cf_value))
+                except (TypeError, ValueError):
+                    custom_values[cf_model.id] = 0
 
     def set_custom_values(self, params):
-        CustomizeObject.set_custom_values(self, params)
-        self.refresh_set_ratio()
+        if self.is_import_mode():
+            self._store_import_custom_values(params)
+        else:
+            CustomizeObject.set_custom_values(self, params)
+            self.refresh_set_ratio()
 
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        if self.id is not None:
+            owner_ids = list(set([self.owner_id] + list(PropertyLot.objects.filter(id=self.id).values_list('owner_id', flat=True))))
+        else:
+            owner_ids = [self.owner_id]
         LucteriosModel.save(self, force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
-        self.refresh_set_ratio()
+        if self.is_import_mode():
+            IMPORT_CONTEXT.owner_ids.update(owner_ids)
+            IMPORT_CONTEXT.custom_values.setdefault(self.id, {})
+        else:
+            self.refresh_set_ratio(owner_ids)
 
     class Meta(object):
         verbose_name = _('property lot')
@@ -1049,6 +1325,21 @@ class CallFundsSupporting(Supporting):
             return Supporting.generate_pdfreport(self)
         return None
 
+    def render_pdfreport(self):
+        self.pdfreport_rendered = None
+        self.pdfreport_render_only = True
+        try:
+            self.generate_pdfreport()
+        finally:
+            self.pdfreport_render_only = False
+        return self.pdfreport_rendered
+
+    def add_pdf_document(self, title, user, metadata, pdf_content):
+        if getattr(self, 'pdfreport_render_only', False):
+            self.pdfreport_rendered = (title, metadata, pdf_content)
+            return None
+        return Supporting.add_pdf_document(self, title, user, metadata, pdf_content)
+
     def get_send_email_objects(self):
         try:
             return [self.callfunds]
@@ -1162,7 +1453,6 @@ class CallFunds(LucteriosModel):
     def get_total(self):
         if self.id is None:
             return 0
-        self.check_supporting()
         val = 0
         for calldetail in self.calldetail_set.all():
             val += currency_round(calldetail.price)
@@ -1177,6 +1467,22 @@ class CallFunds(LucteriosModel):
         if self.supporting is not None:
             self.supporting.set_context(xfer)
 
+    def get_details_by_owner(self, calls_by_owner):
+        partitions_by_set = {}
+        new_details = []
+        for calldetail in self.calldetail_set.all():
+            if calldetail.set_id not in partitions_by_set:
+                partitions_by_set[calldetail.set_id] = list(Partition.objects.filter(set_id=calldetail.set_id).order_by('value').values_list('owner_id', 'value'))
+            partitions = [(owner_id, value) for owner_id, value in partitions_by_set[calldetail.set_id] if value > 0.001]
+            if len(partitions) == 0:
+                raise LucteriosException(IMPORTANT, _("Category of charge not fill!"))
+            total_part = sum([value for _owner_id, value in partitions_by_set[calldetail.set_id]])
+            prices = ventilate_amount(calldetail.price, [value for _owner_id, value in partitions], total_part)
+            for (owner_id, _value), price in zip(partitions, prices):
+                new_details.append(CallDetail(callfunds=calls_by_owner[owner_id], type_call=calldetail.type_call, set_id=calldetail.set_id,
+                                              designation=calldetail.designation, price=price))
+        return new_details
+
     transitionname__valid = _("Valid")
 
     @transition(field=status, source=STATUS_BUILDING, target=STATUS_VALID, conditions=[lambda item:(Owner.objects.filter(third__status=Third.STATUS_ENABLE).count() > 0) and (item.calldetail_set.count() > 0)])
@@ -1191,39 +1497,37 @@ class CallFunds(LucteriosModel):
             new_num = val['num__max'] + 1
         last_call = None
         last_user = getattr(self, 'last_user', None)
+        in_background = CallFundsJob.is_enabled()
         calls_by_owner = {}
-        for owner in Owner.objects.filter(third__status=Third.STATUS_ENABLE):
+        for owner in Owner.objects.filter(third__status=Third.STATUS_ENABLE).select_related('third'):
             calls_by_owner[owner.id] = CallFunds.objects.create(num=new_num, date=self.date, owner=owner, comment=self.comment,
                                                                 status=self.STATUS_VALID, supporting=CallFundsSupporting.objects.create(third=owner.third))
             setattr(calls_by_owner[owner.id].supporting, 'last_user', last_user)
             last_call = calls_by_owner[owner.id]
-        for calldetail in self.calldetail_set.all():
-            amount = float(calldetail.price)
-            new_detail = None
-            for part in calldetail.set.partition_set.all().order_by('value'):
-                if part.value > 0.001:
-                    new_detail = CallDetail.objects.create(type_call=calldetail.type_call,
-                                                           set=calldetail.set, designation=calldetail.designation)
-                    new_detail.callfunds = calls_by_owner[part.owner.id]
-                    new_detail.price = currency_round(float(calldetail.price) * part.get_ratio() / 100.0)
-                    amount -= new_detail.price
-                    new_detail.save()
-            if new_detail is None:
-                raise LucteriosException(IMPORTANT, _("Category of charge not fill!"))
-            if abs(amount) > 0.0001:
-                new_detail.price += amount
-                new_detail.save()
-        for new_call in calls_by_owner.values():
-            if new_call.get_total() < 0.0001:
+        new_details = self.get_details_by_owner(calls_by_owner)
+        bulk_create_with_auditlog(CallDetail, new_details)
+        totals_by_call = {}
+        for new_detail in new_details:
+            totals_by_call[new_detail.callfunds.id] = totals_by_call.get(new_detail.callfunds.id, 0) + currency_round(new_detail.price)
+        report_call_ids = []
+        owner_ids = []
+        for owner_id, new_call in calls_by_owner.items():
+            if totals_by_call.get(new_call.id, 0) < 0.0001:
                 new_call.delete()
             else:
+                owner_ids.append(owner_id)
                 new_call.generate_accounting()
-                new_call.generate_pdfreport()
+                if in_background:
+                    report_call_ids.append(new_call.id)
+                else:
+                    new_call.generate_pdfreport()
         self.delete()
         if last_call is not None:
             self.__dict__ = last_call.__dict__
-        for owner in Owner.objects.filter(third__status=Third.STATUS_ENABLE):
-            owner.ventilatePay()
+        if in_background:
+            CallFundsJob.add_job(new_num, report_call_ids, owner_ids, last_user)
+        else:
+            Owner.add_to_ventilate(owner_ids)
 
     transitionname__close = _("Closed")
 
@@ -1233,35 +1537,35 @@ class CallFunds(LucteriosModel):
 
     @classmethod
     def devalid(cls, min_num):
-        for owner in Owner.objects.filter(third__status=Third.STATUS_ENABLE):
+        owners = Owner.objects.filter(third__status=Third.STATUS_ENABLE, callfunds__num__gte=min_num).distinct()
+        owner_ids = list(owners.values_list('id', flat=True))
+        for owner in owners:
             owner.deventilate_calloffunds(min_num)
-        for num_item in cls.objects.filter(num__gte=min_num).values_list('num', flat=True).distinct():
-            call_details = {}
-            date = None
-            comment = None
-            entries = []
-            for call_item in cls.objects.filter(num=num_item):
-                date = call_item.date
-                comment = call_item.comment
-                if call_item.payoff_set.all().count() > 0:
-                    raise LucteriosException(IMPORTANT, _("An payoff of a call of funds is validated !"))
-                for detail in call_item.calldetail_set.all():
-                    itend = (detail.type_call, detail.set_id, detail.designation)
-                    if itend not in call_details:
-                        call_details[itend] = 0.0
-                    call_details[itend] += float(detail.price)
-                    if detail.entry is not None:
-                        if detail.entry.close:
-                            raise LucteriosException(IMPORTANT, _("An entry account of a call of funds is validated !"))
-                        entries.append(detail.entry)
-                call_item.delete()
-            for entry in entries:
-                entry.delete()
-            new_call = CallFunds.objects.create(date=date, comment=comment)
-            for ident, price in call_details.items():
-                CallDetail.objects.create(callfunds=new_call, type_call=ident[0], set_id=ident[1], designation=ident[2], price=price)
-        for owner in Owner.objects.filter(third__status=Third.STATUS_ENABLE):
-            owner.ventilatePay()
+        calls = cls.objects.filter(num__gte=min_num)
+        if Payoff.objects.filter(supporting__callfundssupporting__callfunds__in=calls).exists():
+            raise LucteriosException(IMPORTANT, _("An payoff of a call of funds is validated !"))
+        details = CallDetail.objects.filter(callfunds__in=calls)
+        if details.filter(entry__close=True).exists():
+            raise LucteriosException(IMPORTANT, _("An entry account of a call of funds is validated !"))
+        entry_ids = list(details.filter(entry__isnull=False).values_list('entry_id', flat=True).distinct())
+        call_headers = {}
+        for num_item, call_date, call_comment in calls.order_by('num', 'id').values_list('num', 'date', 'comment'):
+            call_headers[num_item] = (call_date, call_comment)
+        call_details = {}
+        for detail_sum in details.values('callfunds__num', 'type_call', 'set_id', 'designation').annotate(price_sum=Sum('price'), first_id=Min('id')).order_by('callfunds__num', 'first_id'):
+            call_details.setdefault(detail_sum['callfunds__num'], []).append(detail_sum)
+        calls.delete()
+        for entry in EntryAccount.objects.filter(Q(id__in=entry_ids) & (Q(link__isnull=False) | Q(entrylineaccount__link__isnull=False))).distinct():
+            entry.delete()
+        EntryAccount.objects.filter(id__in=entry_ids).delete()
+        new_details = []
+        for num_item, (call_date, call_comment) in call_headers.items():
+            new_call = CallFunds.objects.create(date=call_date, comment=call_comment)
+            for detail_sum in call_details.get(num_item, []):
+                new_details.append(CallDetail(callfunds=new_call, type_call=detail_sum['type_call'], set_id=detail_sum['set_id'],
+                                              designation=detail_sum['designation'], price=detail_sum['price_sum']))
+        bulk_create_with_auditlog(CallDetail, new_details)
+        Owner.add_to_ventilate(owner_ids)
 
     def generate_accounting(self, fiscal_year=None):
         if (self.owner is not None) and (self.status == self.STATUS_VALID) and not Params.getvalue("condominium-old-accounting"):
@@ -1290,6 +1594,11 @@ class CallFunds(LucteriosModel):
         if is_modify:
             self.save()
 
+    @classmethod
+    def check_all_supporting(cls):
+        for callfunds in cls.objects.filter((Q(owner__isnull=False) & Q(supporting__isnull=True)) | Q(type_call__isnull=False)):
+            callfunds.check_supporting()
+
     def payoff_have_payment(self):
         if (self.supporting is not None):
             return self.supporting.payoff_have_payment()
@@ -1340,6 +1649,17 @@ class CallDetail(LucteriosModel):
     def get_edit_fields(cls):
         return ['type_call', "set", "designation", "price"]
 
+    @classmethod
+    def get_price_sum(cls):
+        return Sum(Round('price', Params.getvalue("accounting-devise-prec")), output_field=models.FloatField())
+
+    @classmethod
+    def get_total_price(cls, query):
+        total = cls.objects.filter(query).aggregate(sum=cls.get_price_sum())
+        if total['sum'] is None:
+            return 0
+        return currency_round(total['sum'])
+
     def get_type_call_ex(self):
         if self.id is None:
             return None
@@ -1719,19 +2039,13 @@ class ExpenseDetail(LucteriosModel):
         return ratio
 
     def generate_ratio(self, is_asset):
-        price = currency_round(self.price)
-        last_line = None
-        total = 0
-        for part in Partition.objects.filter(set=self.set).order_by('value'):
-            amount = currency_round(price * part.get_ratio() / 100.0)
+        partitions = list(Partition.objects.filter(set=self.set).order_by('value').values_list('owner_id', 'value'))
+        amounts = ventilate_amount(currency_round(self.price), [value for _owner_id, value in partitions])
+        for (owner_id, _value), amount in zip(partitions, amounts):
             if amount > 0.0001:
-                last_line, _created = ExpenseRatio.objects.get_or_create(expensedetail=self, owner=part.owner)
-                last_line.value = is_asset * amount
-                last_line.save()
-                total += amount
-        if (last_line is not None) and (abs(price - total) > 0.0001):
-            last_line.value += is_asset * (price - total)
-            last_line.save()
+                ratio, _created = ExpenseRatio.objects.get_or_create(expensedetail=self, owner_id=owner_id)
+                ratio.value = is_asset * amount
+                ratio.save()
 
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
         self.expense_account = correct_accounting_code(self.expense_account)
@@ -1792,17 +2106,38 @@ class PaymentSet(QuerySet):
         self.date_begin = self._hints['date_begin']
         self.date_end = self._hints['date_end']
 
+    def get_assignments(self, entry_ids):
+        supporting_ids_by_entry = {}
+        for entry_id, supporting_id in Payoff.objects.filter(entry_id__in=entry_ids, supporting__third=self.third).order_by('supporting_id').values_list('entry_id', 'supporting_id').distinct():
+            supporting_ids_by_entry.setdefault(entry_id, []).append(supporting_id)
+        supporting_ids = set([supporting_id for supporting_ids in supporting_ids_by_entry.values() for supporting_id in supporting_ids])
+        supportings = {}
+        related_by_model = {CallFundsSupporting: 'callfunds__owner__third__contact', Owner: 'third__contact', Expense: None}
+        for rel_obj in Supporting._meta.related_objects:
+            if rel_obj.one_to_one and rel_obj.field.remote_field.parent_link and (len(supporting_ids) > len(supportings)):
+                children = rel_obj.related_model.objects.filter(pk__in=supporting_ids)
+                related_field = related_by_model.get(rel_obj.related_model, 'third__contact')
+                if related_field is not None:
+                    children = children.select_related(related_field)
+                for child in children:
+                    supportings[child.pk] = child.get_final_child()
+        for supporting in Supporting.objects.filter(id__in=supporting_ids - set(supportings.keys())):
+            supportings[supporting.id] = supporting
+        return {entry_id: '{[br/]}'.join([str(supportings[supporting_id]) for supporting_id in supporting_ids]) for entry_id, supporting_ids in supporting_ids_by_entry.items()}
+
     def _fetch_all(self):
         if self._result_cache is None:
             self._result_cache = []
             payoff_filter = Q(supporting__is_revenu=True) & Q(supporting__third=self.third)
             payoff_filter &= Q(date__gte=self.date_begin)
             payoff_filter &= Q(date__lte=self.date_end)
-            for payoff in Payoff.objects.filter(payoff_filter).values('entry_id', 'date', 'reference', 'mode', 'bank_account__designation').annotate(amount=Sum('amount')).order_by('date'):
+            payoffs = list(Payoff.objects.filter(payoff_filter).values('entry_id', 'date', 'reference', 'mode', 'bank_account__designation').annotate(amount=Sum('amount')).order_by('date'))
+            assignments = self.get_assignments([payoff['entry_id'] for payoff in payoffs])
+            for payoff in payoffs:
                 paymentid = payoff['entry_id']
                 self._result_cache.append(Payment(id=paymentid,
                                                   date=payoff['date'],
-                                                  assignment='{[br/]}'.join([str(supporting.get_final_child()) for supporting in Supporting.objects.filter(payoff__entry=payoff['entry_id'], third=self.third).distinct()]),
+                                                  assignment=assignments.get(paymentid, ''),
                                                   amount=payoff['amount'],
                                                   mode=payoff['mode'],
                                                   bank_account=payoff['bank_account__designation'],
@@ -1844,8 +2179,10 @@ class Owner(Supporting):
         self.date_begin = None
         self.date_end = None
         self.current_year = None
+        self.computed_totals = {}
 
     def set_dates(self, begin_date=None, end_date=None):
+        last_dates = (self.date_begin, self.date_end)
         if begin_date is None:
             self.current_year = None
         else:
@@ -1866,11 +2203,126 @@ class Owner(Supporting):
             self.date_end = convert_date(self.date_end)
         if self.date_end < self.date_begin:
             self.date_end = self.date_begin
+        if last_dates != (self.date_begin, self.date_end):
+            self.computed_totals = {}
 
     def set_context(self, xfer):
         if xfer is not None:
             self.set_dates(xfer.getparam("begin_date"), xfer.getparam("end_date"))
 
+    @classmethod
+    def prepare_totals(cls, owners, begin_date=None, end_date=None):
+        owners = [owner for owner in owners if owner.id is not None]
+        if len(owners) == 0:
+            return
+        owners[0].set_dates(begin_date, end_date)
+        for owner in owners:
+            owner.current_year = owners[0].current_year
+            owner.date_begin = owners[0].date_begin
+            owner.date_end = owners[0].date_end
+            owner.computed_totals = {}
+        date_begin = owners[0].date_begin
+        date_end = owners[0].date_end
+        current_year = owners[0].current_year
+        third_ids = [owner.third_id for owner in owners]
+
+        def sum_by_third(entry_query):
+            return dict(EntryLineAccount.objects.filter(entry_query & Q(third_id__in=third_ids)).order_by().values('third_id').annotate(sum=Sum('amount')).values_list('third_id', 'sum'))
+
+        total_part = PropertyLot.get_total_part()
+        lot_values = dict(PropertyLot.objects.filter(owner__in=owners).order_by().values('owner_id').annotate(sum=Sum('value')).values_list('owner_id', 'sum'))
+
+        third_initials = {}
+        year = FiscalYear.objects.filter(begin__lte=date_begin, end__gte=date_begin).first()
+        if year is not None:
+            lastyear_lines = EntryLineAccount.objects.filter(Q(third_id__in=third_ids) & Q(entry__year=year) & Q(entry__journal__id=Journal.DEFAULT_LASTYEAR))
+            for item in lastyear_lines.order_by().values('third_id').annotate(sum=Sum('amount')):
+                third_initials[item['third_id']] = -1 * item['sum']
+            if (year.status == FiscalYear.STATUS_BUILDING) and (year.last_fiscalyear is not None):
+                third_query = Q(third_id__in=[third_id for third_id in third_ids if third_id not in third_initials])
+                third_query &= Q(entry__date_value__lte=year.last_fiscalyear.end) & ~Q(entry__designation=current_system_account().CLOSE_TITLE_THIRD)
+                for item in EntryLineAccount.objects.filter(third_query).order_by().values('third_id', 'account__type_of_account').annotate(sum=Sum('amount')):
+                    if item['account__type_of_account'] == 0:
+                        third_initials[item['third_id']] = third_initials.get(item['third_id'], 0) - item['sum']
+                    else:
+                        third_initials[item['third_id']] = third_initials.get(item['third_id'], 0) + item['sum']
+            for third_id, amount in sum_by_third(Q(entry__year=year) & Q(entry__date_value__lt=date_begin) & ~Q(entry__journal__id=Journal.DEFAULT_LASTYEAR)).items():
+                third_initials[third_id] = third_initials.get(third_id, 0) - amount
+
+        calls = cls.get_call_totals([owner.id for owner in owners], date_begin, date_end)
+
+        payoff_query = Q(entry__date_value__gte=date_begin) & Q(entry__date_value__lte=date_end) & Q(entry__year=current_year)
+        payoff_query &= (Q(entry__journal__id=Journal.DEFAULT_OTHER) | Q(entry__journal__id=Journal.DEFAULT_PAYMENT))
+        payoffs = {}
+        initials = {}
+        owner_totals = {}
+        for owner_type in (DEFAULT_ACCOUNT_ALL, DEFAULT_ACCOUNT_CURRENT):
+            payoffs[owner_type] = sum_by_third(payoff_query & Q(account_id__in=get_account_ids(owners[0].get_third_mask(owner_type), current_year)))
+        initial_query = Q(entry__year=current_year) & Q(account_id__in=get_account_ids(owners[0].get_third_mask(DEFAULT_ACCOUNT_CURRENT), current_year))
+        initial_before = sum_by_third(initial_query & Q(entry__date_value__lt=date_begin) & ~Q(entry__journal__id=Journal.DEFAULT_LASTYEAR))
+        initial_lastyear = sum_by_third(initial_query & Q(entry__journal__id=Journal.DEFAULT_LASTYEAR))
+        history_year_ids = get_year_ids(date_end)
+        for owner_type in (DEFAULT_ACCOUNT_CURRENT, DEFAULT_ACCOUNT_EXCEPTIONNEL):
+            owner_totals[owner_type] = sum_by_third(Q(entry__date_value__lte=date_end) & Q(account_id__in=get_account_ids(owners[0].get_third_mask(owner_type), history_year_ids)))
+        period_query = Q(account_id__in=get_account_ids(owners[0].get_third_mask(DEFAULT_ACCOUNT_ALL), get_year_ids(date_end, date_begin))) & Q(entry__date_value__gte=date_begin) & Q(entry__date_value__lte=date_end)
+        period_query &= ~Q(entry__journal__id=Journal.DEFAULT_LASTYEAR) & ~Q(entry__designation=current_system_account().CLOSE_TITLE_THIRD)
+        period_amounts = sum_by_third(period_query)
+
+        old_accounting = Params.getvalue("condominium-old-accounting")
+        for owner in owners:
+            if total_part > 0:
+                value = lot_values.get(owner.id, 0)
+                owner.computed_totals['property_part'] = (value, total_part, 100.0 * float(value) / float(total_part))
+            else:
+                owner.computed_totals['property_part'] = (None, None, None)
+            owner.computed_totals['third_initial'] = third_initials.get(owner.third_id, 0)
+            for type_call in [-1] + [item[0] for item in CallDetail.LIST_TYPECALLS]:
+                owner.computed_totals[('call', type_call)] = calls.get((owner.id, type_call), 0)
+            for owner_type, payoff_values in payoffs.items():
+                owner.computed_totals[('payoff', owner_type)] = -1 * payoff_values.get(owner.third_id, 0)
+            owner.computed_totals[('initial', DEFAULT_ACCOUNT_CURRENT)] = initial_before.get(owner.third_id, 0) - initial_lastyear.get(owner.third_id, 0)
+            for owner_type, owner_values in owner_totals.items():
+                owner.computed_totals[('owner', owner_type)] = -1 * owner_values.get(owner.third_id, 0)
+            if old_accounting:
+                owner.computed_totals['thirdtotal'] = owner.computed_totals['third_initial'] - owner.computed_totals[('call', -1)] + owner.computed_totals[('payoff', DEFAULT_ACCOUNT_ALL)]
+            else:
+                owner.computed_totals['thirdtotal'] = owner.computed_totals['third_initial'] - period_amounts.get(owner.third_id, 0)
+
+    @classmethod
+    def get_call_totals(cls, owner_ids, date_begin, date_end):
+        calls = {}
+        callfunds_totals = {}
+        callfunds_with_set = set()
+        for callfunds_id, owner_id, type_call, set_id, price in CallDetail.objects.filter(callfunds__owner_id__in=owner_ids, callfunds__date__gte=date_begin, callfunds__date__lte=date_end).values_list('callfunds_id', 'callfunds__owner_id', 'type_call', 'set_id', 'price'):
+            callfunds_totals[(owner_id, callfunds_id)] = callfunds_totals.get((owner_id, callfunds_id), 0) + currency_round(price)
+            if set_id is not None:
+                callfunds_with_set.add((owner_id, callfunds_id))
+                calls[(owner_id, type_call)] = calls.get((owner_id, type_call), 0) + currency_round(price)
+        for owner_id, callfunds_id in callfunds_with_set:
+            calls[(owner_id, -1)] = calls.get((owner_id, -1), 0) + currency_round(callfunds_totals[(owner_id, callfunds_id)])
+        return calls
+
+    @classmethod
+    def get_payed_totals(cls, owner_ids, date_begin, date_end, ignore_payoff=-1):
+        callfunds_owners = dict(CallFunds.objects.filter(Q(owner_id__in=owner_ids) & Q(date__gte=date_begin) & Q(date__lte=date_end)).values_list('id', 'owner_id'))
+        callfunds_payed = {}
+        payoff_query = Q(supporting__callfundssupporting__callfunds__in=list(callfunds_owners.keys())) & ~Q(id=ignore_payoff)
+        for callfunds_id, amount in Payoff.objects.filter(payoff_query).values_list('supporting__callfundssupporting__callfunds', 'amount'):
+            callfunds_payed[callfunds_id] = callfunds_payed.get(callfunds_id, 0) + currency_round(amount)
+        callfunds_details = {}
+        for callfunds_id, type_call, price in CallDetail.objects.filter(callfunds_id__in=list(callfunds_owners.keys())).values_list('callfunds_id', 'type_call', 'price'):
+            callfunds_details.setdefault(callfunds_id, []).append((type_call, price))
+        payed = {}
+        for callfunds_id, owner_id in callfunds_owners.items():
+            total_payed = callfunds_payed.get(callfunds_id, 0)
+            payed[(owner_id, -1)] = payed.get((owner_id, -1), 0) + currency_round(total_payed)
+            details = callfunds_details.get(callfunds_id, [])
+            total = sum([currency_round(price) for _type_call, price in details])
+            if abs(total) > 0.0001:
+                for type_call, price in details:
+                    payed[(owner_id, type_call)] = payed.get((owner_id, type_call), 0) + currency_round(float(price) * total_payed / total)
+        return payed
+
     def get_third_mask(self, type_owner=DEFAULT_ACCOUNT_CURRENT):
         def add_account_rex(typeowner):
             account = Params.getvalue("condominium-default-owner-account%d" % typeowner)
@@ -2045,12 +2497,13 @@ class Owner(Supporting):
         Supporting.save(self, force_insert=force_insert,
                         force_update=force_update, using=using, update_fields=update_fields)
         if is_new:
-            for setitem in Set.objects.all():
-                Partition.objects.create(set=setitem, owner=self)
+            Partition.provide(Set.objects.values_list('id', flat=True), [self.id])
 
     def get_third_initial(self):
         if self.id is None:
             return None
+        if 'third_initial' in self.computed_totals:
+            return self.computed_totals['third_initial']
         if self.date_begin is None:
             self.set_dates()
         third_total = 0
@@ -2112,24 +2565,28 @@ class Owner(Supporting):
     def _deventilate_payoff(self, support_query):
         callfunds_supportings = Supporting.objects.filter(support_query).distinct()
         export_payoff_filter = Q(supporting__in=callfunds_supportings) & Q(entry__close=False)
-        export_payoff_list = Payoff.objects.filter(export_payoff_filter).values('entry_id', 'mode', 'payer', 'reference', 'bank_account_id', 'date').annotate(amount=Sum('amount'), bank_fee=Sum('bank_fee'))
+        export_payoff_list = list(Payoff.objects.filter(export_payoff_filter & ~Q(mode=Payoff.MODE_INTERNAL)).values('entry_id', 'mode', 'payer', 'reference', 'bank_account_id', 'date').annotate(amount=Sum('amount'), bank_fee=Sum('bank_fee')))
+        entry_ids = [export_payoff['entry_id'] for export_payoff in export_payoff_list]
+        entries = EntryAccount.objects.in_bulk(entry_ids)
+        cash_amounts = dict(EntryLineAccount.objects.filter(entry_id__in=entry_ids, account_id__in=get_account_ids(current_system_account().get_cash_mask(), {entry.year_id for entry in entries.values()})).order_by().values('entry_id').annotate(amount_sum=Sum('amount')).values_list('entry_id', 'amount_sum'))
         for export_payoff in export_payoff_list:
-            if export_payoff['mode'] != Payoff.MODE_INTERNAL:
-                entry = EntryAccount.objects.get(id=export_payoff['entry_id'])
-                amount = get_amount_sum(entry.entrylineaccount_set.filter(account__code__regex=current_system_account().get_cash_mask()).aggregate(Sum('amount')))
-                if Payoff.multi_save(supportings=[str(self.id)], amount=amount, mode=export_payoff['mode'],
-                                     payer=export_payoff['payer'], reference=export_payoff['reference'],
-                                     bank_account=export_payoff['bank_account_id'] if export_payoff['bank_account_id'] is not None else 0,
-                                     date=export_payoff['date'], bank_fee=export_payoff['bank_fee'], repartition=1,
-                                     entry=entry if entry.close else None):
-                    if not entry.close:
-                        entry.delete()
-                else:
-                    raise LucteriosException(IMPORTANT, _('no deletable !'))
+            entry = entries[export_payoff['entry_id']]
+            if Payoff.multi_save(supportings=[str(self.id)], amount=cash_amounts.get(entry.id) or 0, mode=export_payoff['mode'],
+                                 payer=export_payoff['payer'], reference=export_payoff['reference'],
+                                 bank_account=export_payoff['bank_account_id'] if export_payoff['bank_account_id'] is not None else 0,
+                                 date=export_payoff['date'], bank_fee=export_payoff['bank_fee'], repartition=1,
+                                 entry=entry if entry.close else None):
+                if not entry.close:
+                    entry.delete()
             else:
-                for payoff in Payoff.objects.filter(supporting__in=callfunds_supportings, entry_id=export_payoff['entry_id'], mode=Payoff.MODE_INTERNAL):
-                    payoff.supporting = self
-                    payoff.save()
+                raise LucteriosException(IMPORTANT, _('no deletable !'))
+        internal_payoffs = Payoff.objects.filter(export_payoff_filter & Q(mode=Payoff.MODE_INTERNAL))
+        internal_supportings = list(Supporting.objects.filter(payoff__in=internal_payoffs).distinct())
+        if len(internal_supportings) > 0:
+            for supporting in internal_supportings:
+                supporting.get_final_child().delete_accountlink()
+            Payoff.objects.filter(id__in=list(internal_payoffs.values_list('id', flat=True))).update(supporting=self)
+            self.generate_accountlink()
 
     def deventilate_calloffunds(self, min_num):
         # move payoff of call of fund in owner general list
@@ -2144,12 +2601,11 @@ class Owner(Supporting):
         self._deventilate_payoff(support_query)
 
         # move payoff from general to call of funds
-        supportings = [str(self.id)]
-        for call_fund in self.callfunds_set.filter(date__gte=self.date_begin, date__lte=self.date_end).order_by('date', 'num'):
-            if call_fund.supporting.get_total_rest_topay() > 0.0001:
-                supportings.append(str(call_fund.supporting_id))
+        rest_topay = self.get_callfunds_rest_topay()
+        callfunds_supportings = [supporting_id for supporting_id, rest in rest_topay.items() if rest > 0.0001]
+        supportings = [str(self.id)] + [str(supporting_id) for supporting_id in callfunds_supportings]
         payoffs_filter = Q(date__gte=self.date_begin) & Q(date__lte=self.date_end) & (Q(entry__close=False) | (Q(entry__entrylineaccount__third=self.third) & Q(entry__date_value=FiscalYear.get_current().begin) & Q(entry__journal__id=Journal.DEFAULT_LASTYEAR)))
-        payoffs = self.payoff_set.filter(payoffs_filter).distinct().order_by('date')
+        payoffs = self.payoff_set.filter(payoffs_filter).select_related('entry').distinct().order_by('date')
         for payoff in payoffs:
             if payoff.mode != Payoff.MODE_INTERNAL:
                 if Payoff.multi_save(supportings=supportings, amount=payoff.amount, mode=payoff.mode,
@@ -2161,18 +2617,34 @@ class Owner(Supporting):
                         payoff.entry = None
                         payoff.save(do_generate=False)
                     payoff.delete()
+                rest_topay = None
             else:
-                for call_fund in self.callfunds_set.filter(supporting__in=supportings).order_by('date', 'num'):
-                    if (call_fund.supporting.get_total_rest_topay() - float(payoff.amount)) > 0.0001:
-                        payoff.supporting = call_fund.supporting
-                        payoff.save()
+                if rest_topay is None:
+                    rest_topay = self.get_callfunds_rest_topay()
+                new_supporting_id = None
+                for supporting_id in callfunds_supportings:
+                    if (rest_topay[supporting_id] - float(payoff.amount)) > 0.0001:
+                        new_supporting_id = supporting_id
+                if new_supporting_id is not None:
+                    payoff.supporting = CallFundsSupporting.objects.get(id=new_supporting_id)
+                    payoff.save()
+                    rest_topay[new_supporting_id] -= currency_round(payoff.amount)
+
+    def get_callfunds_rest_topay(self):
+        callfunds_list = self.callfunds_set.filter(date__gte=self.date_begin, date__lte=self.date_end, supporting__isnull=False).order_by('date', 'num').values_list('id', 'supporting_id')
+        calls_total = dict(CallDetail.objects.filter(callfunds__in=[callfunds_id for callfunds_id, _supporting_id in callfunds_list]).order_by().values('callfunds_id').annotate(value=CallDetail.get_price_sum()).values_list('callfunds_id', 'value'))
+        payed_total = dict(Payoff.objects.filter(supporting__in=[supporting_id for _callfunds_id, supporting_id in callfunds_list]).order_by().values('supporting_id').annotate(value=Sum('amount')).values_list('supporting_id', 'value'))
+        rest_topay = {}
+        for callfunds_id, supporting_id in callfunds_list:
+            rest_topay[supporting_id] = currency_round(calls_total.get(callfunds_id) or 0.0) - currency_round(payed_total.get(supporting_id) or 0.0)
+        return rest_topay
 
     @property
     def entryline_set(self):
         if self.date_begin is None:
             self.set_dates()
         query = Q(third=self.third)
-        query &= Q(account__code__regex=self.get_third_mask(DEFAULT_ACCOUNT_ALL))
+        query &= Q(account_id__in=get_account_ids(self.get_third_mask(DEFAULT_ACCOUNT_ALL), get_year_ids(self.date_end, self.date_begin)))
         query &= Q(entry__date_value__gte=self.date_begin)
         query &= Q(entry__date_value__lte=self.date_end)
         query &= ~Q(entry__journal__id=Journal.DEFAULT_LASTYEAR)
@@ -2194,6 +2666,8 @@ class Owner(Supporting):
     def get_thirdtotal(self):
         if self.id is None:
             return None
+        if 'thirdtotal' in self.computed_totals:
+            return self.computed_totals['thirdtotal']
         if Params.getvalue("condominium-old-accounting"):
             if self.date_begin is None:
                 self.set_dates()
@@ -2211,7 +2685,9 @@ class Owner(Supporting):
 
     @property
     def exceptionnal_set(self):
-        return PartitionExceptional.objects.filter(Q(owner=self) & Q(set__is_active=True) & Q(set__type_load=Set.TYPELOAD_EXCEPTIONAL)).distinct()
+        if self.date_end is None:
+            self.set_dates()
+        return PartitionExceptional.objects.filter(Q(owner=self) & Q(set__is_active=True) & Q(set__type_load=Set.TYPELOAD_EXCEPTIONAL)).with_callfunds(date(1900, 1, 1), self.date_end).distinct()
 
     @property
     def partition_query(self):
@@ -2232,6 +2708,8 @@ class Owner(Supporting):
     def get_property_part(self):
         if self.id is None:
             return None
+        if 'property_part' in self.computed_totals:
+            return self.computed_totals['property_part']
         total_part = PropertyLot.get_total_part()
         if total_part > 0:
             total = self.propertylot_set.aggregate(sum=Sum('value'))
@@ -2249,59 +2727,50 @@ class Owner(Supporting):
     def get_total_call(self, type_call=CallDetail.TYPECALL_CURRENT):
         if self.id is None:
             return None
-        val = 0
-        if type_call < 0:
-            totalfilter = Q(calldetail__set__isnull=False)
-        else:
-            totalfilter = Q(calldetail__type_call=type_call) & Q(calldetail__set__isnull=False)
-        for callfunds in self.callfunds_set.filter(self.callfunds_query & totalfilter).distinct():
-            if type_call < 0:
-                val += currency_round(callfunds.get_total())
-            else:
-                for calldetail in callfunds.calldetail_set.filter(type_call=type_call, set__isnull=False):
-                    val += currency_round(calldetail.price)
-        return val
+        if ('call', type_call) not in self.computed_totals:
+            if self.date_begin is None:
+                self.set_dates()
+            calls = Owner.get_call_totals([self.id], self.date_begin, self.date_end)
+            for call_type in [-1] + [item[0] for item in CallDetail.LIST_TYPECALLS]:
+                self.computed_totals[('call', call_type)] = calls.get((self.id, call_type), 0)
+        return self.computed_totals[('call', type_call)]
 
     def get_total_payed(self, ignore_payoff=-1, type_call=CallDetail.TYPECALL_CURRENT):
         val = Supporting.get_total_payed(self, ignore_payoff=ignore_payoff)
-        if type_call < 0:
-            totalfilter = Q()
-        else:
-            totalfilter = Q(calldetail__type_call=type_call)
-        for callfunds in self.callfunds_set.filter(self.callfunds_query & totalfilter).distinct():
-            callfunds.check_supporting()
-            total_payed = callfunds.supporting.get_total_payed(ignore_payoff)
-            if type_call < 0:
-                val += currency_round(total_payed)
-            else:
-                total = callfunds.get_total()
-                if abs(total) > 0.0001:
-                    for calldetail in callfunds.calldetail_set.filter(type_call=type_call):
-                        val += currency_round(float(calldetail.price) * total_payed / total)
-        return val
+        if self.date_begin is None:
+            self.set_dates()
+        return val + Owner.get_payed_totals([self.id], self.date_begin, self.date_end, ignore_payoff).get((self.id, type_call), 0)
 
     def get_total_initial(self, owner_type=DEFAULT_ACCOUNT_CURRENT):
         if self.id is None:
             return None
+        if ('initial', owner_type) in self.computed_totals:
+            return self.computed_totals[('initial', owner_type)]
         if self.date_begin is None:
             self.set_dates()
+        if self.date_begin == self.current_year.begin:
+            return -1 * OwnerBalance.get_amount(self.third_id, Q(id=self.current_year.id), owner_type, [OwnerBalance.JOURNAL_LASTYEAR])
         entry_query = Q(third=self.third) & Q(entry__date_value__lt=self.date_begin) & Q(entry__year=self.current_year)
-        entry_query &= Q(account__code__regex=self.get_third_mask(owner_type)) & ~Q(entry__journal__id=Journal.DEFAULT_LASTYEAR)
+        entry_query &= Q(account_id__in=get_account_ids(self.get_third_mask(owner_type), self.current_year)) & ~Q(entry__journal__id=Journal.DEFAULT_LASTYEAR)
         third_total = get_amount_sum(EntryLineAccount.objects.filter(entry_query).aggregate(Sum('amount')))
 
         entry_query = Q(third=self.third) & Q(entry__year=self.current_year)
-        entry_query &= Q(entry__journal__id=Journal.DEFAULT_LASTYEAR) & Q(account__code__regex=self.get_third_mask(owner_type))
+        entry_query &= Q(entry__journal__id=Journal.DEFAULT_LASTYEAR) & Q(account_id__in=get_account_ids(self.get_third_mask(owner_type), self.current_year))
         third_total -= get_amount_sum(EntryLineAccount.objects.filter(entry_query).aggregate(Sum('amount')))
         return third_total
 
     def get_total_payoff(self, owner_type=DEFAULT_ACCOUNT_ALL):
         if self.id is None:
             return None
+        if ('payoff', owner_type) in self.computed_totals:
+            return self.computed_totals[('payoff', owner_type)]
         if self.date_begin is None:
             self.set_dates()
+        if (self.date_begin == self.current_year.begin) and (self.date_end == self.current_year.end):
+            return -1 * OwnerBalance.get_amount(self.third_id, Q(id=self.current_year.id), owner_type, [OwnerBalance.JOURNAL_PAYOFF])
         entry_query = Q(third=self.third) & Q(entry__date_value__gte=self.date_begin) & Q(entry__year=self.current_year)
         entry_query &= Q(entry__date_value__lte=self.date_end) & (Q(entry__journal__id=Journal.DEFAULT_OTHER) | Q(entry__journal__id=Journal.DEFAULT_PAYMENT))
-        entry_query &= Q(account__code__regex=self.get_third_mask(owner_type))
+        entry_query &= Q(account_id__in=get_account_ids(self.get_third_mask(owner_type), self.current_year))
         third_total = -1 * get_amount_sum(EntryLineAccount.objects.filter(entry_query).aggregate(Sum('amount')))
         return third_total
 
@@ -2322,7 +2791,7 @@ class Owner(Supporting):
         if self.id is None:
             return None
         value = 0.0
-        for part in self.partition_set.filter(self.partition_query):
+        for part in self.partition_set.filter(self.partition_query).with_total_part():
             part.set.set_dates(self.date_begin, self.date_end)
             value += part.get_ventilated()
         return value
@@ -2331,7 +2800,7 @@ class Owner(Supporting):
         if self.id is None:
             return None
         value = 0.0
-        for part in self.partition_set.filter(self.partition_query):
+        for part in self.partition_set.filter(self.partition_query).with_total_part():
             part.set.set_dates(self.date_begin, self.date_end)
             value += part.get_recovery_load()
         return value
@@ -2359,10 +2828,14 @@ class Owner(Supporting):
             return self.get_total_payoff(DEFAULT_ACCOUNT_CURRENT)
 
     def get_total_current_owner(self):
+        if ('owner', DEFAULT_ACCOUNT_CURRENT) in self.computed_totals:
+            return self.computed_totals[('owner', DEFAULT_ACCOUNT_CURRENT)]
         if self.date_begin is None:
             self.set_dates()
+        if self.date_end == self.current_year.end:
+            return -1 * OwnerBalance.get_amount(self.third_id, Q(end__lte=self.date_end), DEFAULT_ACCOUNT_CURRENT, [item[0] for item in OwnerBalance.LIST_JOURNALS])
         entry_query = Q(third=self.third) & Q(entry__date_value__lte=self.date_end)
-        entry_query &= Q(account__code__regex=self.get_third_mask(DEFAULT_ACCOUNT_CURRENT))
+        entry_query &= Q(account_id__in=get_account_ids(self.get_third_mask(DEFAULT_ACCOUNT_CURRENT), get_year_ids(self.date_end)))
         third_total = get_amount_sum(EntryLineAccount.objects.filter(entry_query).aggregate(Sum('amount')))
         return -1 * third_total
 
@@ -2374,10 +2847,14 @@ class Owner(Supporting):
     def get_total_exceptional_owner(self):
         if self.id is None:
             return None
+        if ('owner', DEFAULT_ACCOUNT_EXCEPTIONNEL) in self.computed_totals:
+            return self.computed_totals[('owner', DEFAULT_ACCOUNT_EXCEPTIONNEL)]
         if self.date_begin is None:
             self.set_dates()
+        if self.date_end == self.current_year.end:
+            return -1 * OwnerBalance.get_amount(self.third_id, Q(end__lte=self.date_end), DEFAULT_ACCOUNT_EXCEPTIONNEL, [item[0] for item in OwnerBalance.LIST_JOURNALS])
         entry_query = Q(third=self.third) & Q(entry__date_value__lte=self.date_end)
-        entry_query &= Q(account__code__regex=self.get_third_mask(DEFAULT_ACCOUNT_EXCEPTIONNEL))
+        entry_query &= Q(account_id__in=get_account_ids(self.get_third_mask(DEFAULT_ACCOUNT_EXCEPTIONNEL), get_year_ids(self.date_end)))
         third_total = get_amount_sum(EntryLineAccount.objects.filter(entry_query).aggregate(Sum('amount')))
         return -1 * third_total
 
@@ -2429,10 +2906,49 @@ class Owner(Supporting):
     def generate_pdfreport(self):
         return None
 
+    @classmethod
+    @contextmanager
+    def deferred_ventilation(cls):
+        depth = getattr(VENTILATION_CONTEXT, 'depth', 0)
+        if depth == 0:
+            VENTILATION_CONTEXT.owners = {}
+        VENTILATION_CONTEXT.depth = depth + 1
+        try:
+            yield
+        finally:
+            VENTILATION_CONTEXT.depth = depth
+        if depth == 0:
+            owners = VENTILATION_CONTEXT.owners
+            VENTILATION_CONTEXT.owners = {}
+            cls._ventilate_owners(owners)
+
+    @classmethod
+    def add_to_ventilate(cls, owner_ids, begin_date=None, end_date=None):
+        owners = {}
+        for owner_id in owner_ids:
+            owners[owner_id] = (begin_date, end_date)
+        if getattr(VENTILATION_CONTEXT, 'depth', 0) > 0:
+            for owner_id, dates in owners.items():
+                VENTILATION_CONTEXT.owners.setdefault(owner_id, dates)
+        else:
+            cls._ventilate_owners(owners)
+
+    @classmethod
+    def _ventilate_owners(cls, owners):
+        if len(owners) > 0:
+            for owner in cls.objects.filter(id__in=list(owners.keys())):
+                begin_date, end_date = owners[owner.id]
+                owner.ventilatePay(begin_date=begin_date, end_date=end_date)
+
     @classmethod
     def ventilate_pay_all(cls, begin_date=None, end_date=None):
-        for owner in cls.objects.all():
-            owner.ventilatePay(begin_date=begin_date, end_date=end_date)
+        if (begin_date is not None) and (end_date is not None):
+            entry_filter = Q(entry__date_value__gte=begin_date) & Q(entry__date_value__lte=end_date)
+        else:
+            entry_filter = Q(entry__year__is_actif=True)
+        active_third_ids = EntryLineAccount.objects.filter(entry_filter & Q(third__status=Third.STATUS_DISABLE)).values('third_id')
+        owners = cls.objects.filter(Q(third__status=Third.STATUS_ENABLE) | Q(third_id__in=active_third_ids))
+        cls.add_to_ventilate(owners.values_list('id', flat=True), begin_date, end_date)
 
     def delete_linked_supporting(self, payoff):
         target_item = payoff.linked_payoff.supporting.get_final_child()
@@ -2446,6 +2962,243 @@ class Owner(Supporting):
             owner.check_account()
 
 
+class OwnerBalance(LucteriosModel):
+    JOURNAL_LASTYEAR = 0
+    JOURNAL_PAYOFF = 1
+    JOURNAL_OTHER = 2
+    LIST_JOURNALS = ((JOURNAL_LASTYEAR, _('last year report')), (JOURNAL_PAYOFF, _('payoff')), (JOURNAL_OTHER, _('other')))
+
+    third = models.ForeignKey(Third, verbose_name=_('third'), null=False, db_index=True, on_delete=models.CASCADE)
+    year = models.ForeignKey(FiscalYear, verbose_name=_('fiscal year'), null=False, db_index=True, on_delete=models.CASCADE)
+    owner_type = models.IntegerField(verbose_name=_('owner account'), null=False, default=DEFAULT_ACCOUNT_ALL)
+    journal_class = models.IntegerField(verbose_name=_('journal'), choices=LIST_JOURNALS, null=False, default=JOURNAL_OTHER)
+    amount = models.FloatField(_('amount'), default=0)
+
+    @classmethod
+    def get_journal_class(cls, journal_id):
+        if journal_id == Journal.DEFAULT_LASTYEAR:
+            return cls.JOURNAL_LASTYEAR
+        elif journal_id in (Journal.DEFAULT_OTHER, Journal.DEFAULT_PAYMENT):
+            return cls.JOURNAL_PAYOFF
+        else:
+            return cls.JOURNAL_OTHER
+
+    @classmethod
+    def refresh(cls, third_id, year_id):
+        owner = Owner()
+        owner_masks = [(owner_type, owner.get_third_mask(owner_type)) for owner_type in (DEFAULT_ACCOUNT_ALL,) + LIST_DEFAULT_ACCOUNTS]
+        amounts = {}
+        for code, journal_id, amount in EntryLineAccount.objects.filter(third_id=third_id, entry__year_id=year_id).order_by().values('account__code', 'entry__journal_id').annotate(sum=Sum('amount')).values_list('account__code', 'entry__journal_id', 'sum'):
+            journal_class = cls.get_journal_class(journal_id)
+            for owner_type, owner_mask in owner_masks:
+                if (owner_mask != '') and (re_search(owner_mask, code) is not None):
+                    amounts[(owner_type, journal_class)] = amounts.get((owner_type, journal_class), 0) + amount
+        upsert_params = {'update_conflicts': True, 'update_fields': ['amount']}
+        if connections[cls.objects.db].features.supports_update_conflicts_with_target:
+            upsert_params['unique_fields'] = ['third', 'year', 'owner_type', 'journal_class']
+        cls.objects.bulk_create([cls(third_id=third_id, year_id=year_id, owner_type=owner_type, journal_class=journal_class, amount=amounts.get((owner_type, journal_class), 0))
+                                 for owner_type, _owner_mask in owner_masks for journal_class, _journal_title in cls.LIST_JOURNALS], **upsert_params)
+
+    @classmethod
+    def rebuild(cls):
+        with transaction.atomic():
+            cls.objects.all().delete()
+            for third_id, year_id in EntryLineAccount.objects.filter(third__in=Owner.objects.values('third_id')).order_by().values_list('third_id', 'entry__year_id').distinct():
+                cls.refresh(third_id, year_id)
+
+    @classmethod
+    def update_third(cls, third_id, year_id):
+        if (third_id is not None) and (year_id is not None) and Owner.objects.filter(third_id=third_id).exists():
+            cls.refresh(third_id, year_id)
+
+    @classmethod
+    def get_amount(cls, third_id, year_query, owner_type, journal_classes):
+        return get_amount_sum(cls.objects.filter(third_id=third_id, year__in=FiscalYear.objects.filter(year_query), owner_type=owner_type, journal_class__in=journal_classes).aggregate(Sum('amount')))
+
+    class Meta(object):
+        verbose_name = _('owner balance')
+        verbose_name_plural = _('owner balances')
+        default_permissions = []
+        unique_together = (('third', 'year', 'owner_type', 'journal_class'),)
+
+
+class CallFundsJob(LucteriosModel):
+    STATUS_WAITING = 0
+    STATUS_RUNNING = 1
+    STATUS_DONE = 2
+    STATUS_FAILURE = 3
+    LIST_STATUS = ((STATUS_WAITING, _('waiting')), (STATUS_RUNNING, _('running')), (STATUS_DONE, _('done')), (STATUS_FAILURE, _('failure')))
+
+    num = models.IntegerField(verbose_name=_('numeros'), null=False)
+    creation_date = models.DateTimeField(verbose_name=_('creation date'), auto_now_add=True)
+    status = models.IntegerField(verbose_name=_('status'), choices=LIST_STATUS, null=False, default=STATUS_WAITING, db_index=True)
+    callfunds_list = models.TextField(verbose_name=_('calls of funds'), default='')
+    owner_list = models.TextField(verbose_name=_('owners'), default='')
+    progress = models.IntegerField(verbose_name=_('progress'), null=False, default=0)
+    user = models.ForeignKey(LucteriosUser, verbose_name=_('user'), null=True, default=None, on_delete=models.SET_NULL)
+    error = models.TextField(verbose_name=_('error'), default='')
+    claim_date = models.DateTimeField(verbose_name=_('claim date'), null=True, default=None)
+    worker = models.CharField(verbose_name=_('worker'), max_length=100, default='')
+
+    def __str__(self):
+        return _('call of funds #%(num)d: %(progress)d/%(total)d') % {'num': self.num, 'progress': self.progress, 'total': self.get_total()}
+
+    @classmethod
+    def is_enabled(cls):
+        return getattr(settings, 'DIACAMMA_CALLFUNDS_BACKGROUND', False)
+
+    @classmethod
+    def get_pending(cls):
+        return cls.objects.filter(status=cls.STATUS_WAITING).order_by('id')
+
+    @classmethod
+    def get_worker_ident(cls):
+        return "%s:%d" % (gethostname(), getpid())
+
+    @classmethod
+    def requeue_stale(cls):
+        nb_requeued = 0
+        for job_item in cls.objects.filter(status=cls.STATUS_RUNNING):
+            if job_item.is_stale():
+                nb_requeued += cls.objects.filter(id=job_item.id, status=cls.STATUS_RUNNING, worker=job_item.worker, claim_date=job_item.claim_date).update(status=cls.STATUS_WAITING, worker='', claim_date=None)
+        return nb_requeued
+
+    @classmethod
+    def add_job(cls, num, callfunds_ids, owner_ids, user=None):
+        if (user is not None) and ((user.id is None) or not user.is_authenticated):
+            user = None
+        new_job = cls.objects.create(num=num, callfunds_list=";".join([str(callfunds_id) for callfunds_id in callfunds_ids]),
+                                     owner_list=";".join([str(owner_id) for owner_id in owner_ids]), user_id=user.id if user is not None else None)
+        transaction.on_commit(lambda: add_callfunds_jobs_in_scheduler(check_nb=False))
+        return new_job
+
+    @property
+    def callfunds_ids(self):
+        return [int(callfunds_id) for callfunds_id in self.callfunds_list.split(';') if callfunds_id != '']
+
+    @property
+    def owner_ids(self):
+        return [int(owner_id) for owner_id in self.owner_list.split(';') if owner_id != '']
+
+    def get_total(self):
+        return len(self.callfunds_ids) + len(self.owner_ids)
+
+    def is_stale(self):
+        if self.status != self.STATUS_RUNNING:
+            return False
+        if (self.claim_date is None) or (self.claim_date < timezone.now() - timedelta(seconds=getattr(settings, 'DIACAMMA_CALLFUNDS_JOB_TIMEOUT', 600))):
+            return True
+        hostname, _sep, pid = self.worker.rpartition(':')
+        if (hostname == gethostname()) and pid.isdigit():
+            try:
+                kill(int(pid), 0)
+            except ProcessLookupError:
+                return True
+            except OSError:
+                pass
+        return False
+
+    def can_retry(self):
+        return (self.status == self.STATUS_FAILURE) or self.is_stale()
+
+    def can_delete(self):
+        if not self.can_retry():
+            return _('Only a failed or interrupted background processing can be deleted!')
+        return ''
+
+    def claim(self):
+        claim_date = timezone.now()
+        worker = self.get_worker_ident()
+        if CallFundsJob.objects.filter(id=self.id, status=self.STATUS_WAITING).update(status=self.STATUS_RUNNING, claim_date=claim_date, worker=worker) != 1:
+            return False
+        self.status = self.STATUS_RUNNING
+        self.claim_date = claim_date
+        self.worker = worker
+        return True
+
+    def retry(self):
+        if not self.can_retry() or (CallFundsJob.objects.filter(id=self.id, status=self.status, worker=self.worker, claim_date=self.claim_date).update(status=self.STATUS_WAITING, error='', worker='', claim_date=None) != 1):
+            raise LucteriosException(IMPORTANT, _('Only a failed or interrupted background processing can be retried!'))
+        self.status = self.STATUS_WAITING
+        self.error = ''
+        self.worker = ''
+        self.claim_date = None
+        transaction.on_commit(lambda: add_callfunds_jobs_in_scheduler(check_nb=False))
+
+    def _render_pdfreports(self, callfunds_ids):
+        # worker processes only see committed data: reports rendered inside a transaction
+        # (as by the synchronous CallFunds.valid) or from an in-memory database stay serial
+        nb_workers = getattr(settings, 'DIACAMMA_CALLFUNDS_PDF_WORKERS', 1)
+        if (nb_workers <= 1) or (len(callfunds_ids) <= 1) or any(conn.in_atomic_block or ((conn.vendor == 'sqlite') and conn.is_in_memory_db()) for conn in connections.all()):
+            return map(render_callfunds_pdfreport, callfunds_ids)
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=nb_workers, mp_context=get_context('spawn'), initializer=django_setup) as pool:
+            return list(pool.map(render_callfunds_pdfreport, callfunds_ids))
+
+    def _store_pdfreport(self, callfunds_id, pdfreport):
+        supporting = CallFundsSupporting.objects.filter(callfunds__id=callfunds_id).first()
+        if (supporting is not None) and (pdfreport is not None):
+            title, metadata, pdf_content = pdfreport
+            supporting.add_pdf_document(title, self.user, metadata, pdf_content)
+
+    def _ventilate_pay(self, owner_id):
+        owner = Owner.objects.filter(id=owner_id).first()
+        if owner is not None:
+            owner.ventilatePay()
+
+    def run(self):
+        if not self.claim():
+            return
+        try:
+            callfunds_ids = self.callfunds_ids
+            steps = []
+            if self.progress < len(callfunds_ids):
+                pending_ids = callfunds_ids[self.progress:]
+                steps.extend([(self._store_pdfreport, (callfunds_id, pdfreport)) for callfunds_id, pdfreport in zip(pending_ids, self._render_pdfreports(pending_ids))])
+            steps.extend([(self._ventilate_pay, (owner_id,)) for owner_id in self.owner_ids[max(0, self.progress - len(callfunds_ids)):]])
+            for step_fct, step_args in steps:
+                with transaction.atomic():
+                    step_fct(*step_args)
+                    self.progress += 1
+                    self.claim_date = timezone.now()
+                    self.save(update_fields=['progress', 'claim_date'])
+            self.status = self.STATUS_DONE
+            self.save(update_fields=['status'])
+        except Exception as job_error:
+            getLogger('diacamma.condominium').exception("CallFundsJob.run")
+            self.status = self.STATUS_FAILURE
+            self.error = str(job_error)
+            self.save(update_fields=['status', 'error'])
+
+    class Meta(object):
+        verbose_name = _('call of funds job')
+        verbose_name_plural = _('call of funds jobs')
+        default_permissions = []
+        ordering = ['-id']
+
+
+def get_account_ids(mask, years):
+    if isinstance(years, (list, tuple, set, QuerySet)):
+        return [account_id for year in years for account_id in get_account_ids(mask, year)]
+    if getattr(ACCOUNT_CONTEXT, 'account_ids', None) is None:
+        ACCOUNT_CONTEXT.account_ids = {}
+    ident = (getattr(years, 'id', years), mask)
+    if ident not in ACCOUNT_CONTEXT.account_ids:
+        ACCOUNT_CONTEXT.account_ids[ident] = list(ChartsAccount.objects.filter(Q(code__regex=mask) & Q(year=years)).values_list('id', flat=True))
+    return ACCOUNT_CONTEXT.account_ids[ident]
+
+
+def get_year_ids(date_end, date_begin=None):
+    year_query = Q(begin__lte=date_end)
+    if date_begin is not None:
+        year_query &= Q(end__gte=date_begin)
+    return list(FiscalYear.objects.filter(year_query).values_list('id', flat=True))
+
+
+def clear_account_ids():
+    ACCOUNT_CONTEXT.account_ids = None
+
+
 def convert_accounting(year, thirds_convert):
     year.getorcreate_chartaccount(correct_accounting_code(Params.getvalue('condominium-default-owner-account1')),
                                   'Copropriétaire - budget prévisionnel')
@@ -2630,10 +3383,88 @@ def condominium_checkparam():
     current_system_condo().check_account_config()
 
 
+# OwnerBalance is only kept up to date by these signals: entry lines written with
+# bulk_create() or QuerySet.update() must call OwnerBalance.refresh() themselves.
+@receiver(pre_save, sender=EntryLineAccount)
+@receiver(pre_save, sender=OwnerEntryLineAccount)
+@receiver(pre_delete, sender=EntryLineAccount)
+@receiver(pre_delete, sender=OwnerEntryLineAccount)
+def condominium_balance_line_before(sender, instance, **kwargs):
+    instance.balance_old_keys = []
+    if instance.id is not None:
+        instance.balance_old_keys = list(EntryLineAccount.objects.filter(id=instance.id).values_list('third_id', 'entry__year_id'))
+
+
+@receiver(post_save, sender=EntryLineAccount)
+@receiver(post_save, sender=OwnerEntryLineAccount)
+@receiver(post_delete, sender=EntryLineAccount)
+@receiver(post_delete, sender=OwnerEntryLineAccount)
+def condominium_balance_line_after(sender, instance, **kwargs):
+    balance_keys = set(getattr(instance, 'balance_old_keys', []))
+    if 'created' in kwargs:
+        balance_keys.add((instance.third_id, instance.entry.year_id))
+    for third_id, year_id in balance_keys:
+        OwnerBalance.update_third(third_id, year_id)
+
+
+@receiver(post_save, sender=EntryAccount)
+def condominium_balance_entry(sender, instance, **kwargs):
+    for third_id in set(instance.entrylineaccount_set.filter(third__isnull=False).values_list('third_id', flat=True)):
+        OwnerBalance.update_third(third_id, instance.year_id)
+
+
+@receiver(post_save, sender=Owner)
+def condominium_balance_owner(sender, instance, created, **kwargs):
+    if created:
+        for year_id in set(EntryLineAccount.objects.filter(third_id=instance.third_id).values_list('entry__year_id', flat=True)):
+            OwnerBalance.refresh(instance.third_id, year_id)
+
+
+@receiver(post_save, sender=ChartsAccount)
+@receiver(post_delete, sender=ChartsAccount)
+def condominium_clear_account_cache(sender, instance, **kwargs):
+    clear_account_ids()
+
+
+@receiver(request_started)
+@receiver(request_finished)
+def condominium_clear_request_cache(sender, **kwargs):
+    clear_account_ids()
+
+
+def render_callfunds_pdfreport(callfunds_id):
+    supporting = CallFundsSupporting.objects.filter(callfunds__id=callfunds_id).first()
+    if supporting is None:
+        return None
+    if DocumentContainer.objects.filter(metadata='%s-%d' % (supporting.__class__.__name__, supporting.id)).exists():
+        return None
+    return supporting.render_pdfreport()
+
+
+def run_callfunds_jobs():
+    '''Calls of funds'''
+    clear_account_ids()
+    job_list = CallFundsJob.get_pending()
+    if len(job_list) == 0:
+        LucteriosScheduler.remove(run_callfunds_jobs)
+    else:
+        for job_item in job_list:
+            job_item.run()
+
+
+@Signal.decorate('scheduler_refresh')
+def add_callfunds_jobs_in_scheduler(check_nb=True):
+    CallFundsJob.requeue_stale()
+    if not check_nb or (CallFundsJob.get_pending().count() > 0):
+        LucteriosScheduler.add_task(run_callfunds_jobs, minutes=0.1)
+
+
 @Signal.decorate('convertdata')
 def condominium_convertdata():
     migrate_budget()
     Set.correct_costaccounting()
+    CallFunds.check_all_supporting()
+    OwnerBalance.rebuild()
     correct_db_field({
         'condominium_recoverableloadratio': 'ratio',
         'condominium_partition': 'value',
@@ -35,6 +35,7 @@ from diacamma.accounting.tools import currency_round
 from diacamma.accounting.models import FiscalYear, EntryAccount, EntryLineAccount, ChartsAccount, Third
 
 from diacamma.condominium.models import CallDetail, Owner, PropertyLot, DEFAULT_ACCOUNT_EXCEPTIONNEL
+from diacamma.condominium.tools import ventilate_amount
 
 
 class DefaultSystemCondo(object):
@@ -116,20 +117,16 @@ class DefaultSystemCondo(object):
             close_entry = EntryAccount(year=fiscal_year, designation=_("Ventilation for %s") % own_set, journal_id=5)
             close_entry.check_date()
             close_entry.save()
-            amount = 0
-            last_line = None
-            for part in own_set.partition_set.all().order_by('value'):
-                value = currency_round(result * part.get_ratio() / 100.0)
+            partitions = list(own_set.partition_set.all().select_related('owner__third').order_by('value'))
+            values = ventilate_amount(result, [part.value for part in partitions])
+            has_line = False
+            for part, value in zip(partitions, values):
                 if abs(value) > 0.0001:
                     owner_account = part.owner.third.get_account(fiscal_year, part.owner.get_third_mask(type_owner))
-                    last_line = EntryLineAccount.objects.create(account=owner_account, amount=-1 * value, entry=close_entry, third=part.owner.third)
-                    amount += value
-            if last_line is None:
+                    EntryLineAccount.objects.create(account=owner_account, amount=-1 * value, entry=close_entry, third=part.owner.third)
+                    has_line = True
+            if not has_line:
                 raise LucteriosException(IMPORTANT, _('The class load %s has no owner') % own_set)
-            diff = currency_round(result - amount)
-            if abs(diff) > 0.0001:
-                last_line.amount -= diff
-                last_line.save()
             reserve_account = ChartsAccount.get_account(initial_code, fiscal_year)
             EntryLineAccount.objects.create(account=reserve_account, amount=-1 * result, entry=close_entry, costaccounting=cost_accounting)
             close_entry.closed()
@@ -145,24 +142,13 @@ class DefaultSystemCondo(object):
                 close_entry.check_date()
                 close_entry.save()
                 if ventilate == 0:
-                    amount = 0
-                    biggerowner_val = 0
-                    biggerowner_line = None
-                    for owner in Owner.objects.filter(third__status=Third.STATUS_ENABLE):
-                        total = owner.propertylot_set.aggregate(sum=Sum('value'))
-                        if ('sum' in total.keys()) and (total['sum'] is not None):
-                            value = currency_round(result * total['sum'] / total_part)
-                            if abs(value) > 0.0001:
-                                owner_account = owner.third.get_account(fiscal_year, owner.get_third_mask(1))
-                                last_line = EntryLineAccount.objects.create(account=owner_account, amount=-1 * value, entry=close_entry, third=owner.third)
-                                if biggerowner_val < total['sum']:
-                                    biggerowner_val = total['sum']
-                                    biggerowner_line = last_line
-                                amount += value
-                    diff = currency_round(result - amount)
-                    if abs(diff) > 0.0001:
-                        biggerowner_line.amount -= diff
-                        biggerowner_line.save()
+                    owners = list(Owner.objects.filter(third__status=Third.STATUS_ENABLE).select_related('third').annotate(lots_sum=Sum('propertylot__value')).filter(lots_sum__isnull=False))
+                    lots_sums = [owner.lots_sum for owner in owners]
+                    values = ventilate_amount(result, lots_sums, total_part, lots_sums.index(max(lots_sums)) if len(lots_sums) > 0 else None)
+                    for owner, value in zip(owners, values):
+                        if abs(value) > 0.0001:
+                            owner_account = owner.third.get_account(fiscal_year, owner.get_third_mask(1))
+                            EntryLineAccount.objects.create(account=owner_account, amount=-1 * value, entry=close_entry, third=owner.third)
                 else:
                     EntryLineAccount.objects.create(account_id=ventilate, amount=result, entry=close_entry)
                 reserve_account = ChartsAccount.get_account(Params.getvalue("condominium-current-revenue-account"), fiscal_year)
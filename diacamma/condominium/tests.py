@@ -24,9 +24,15 @@ along with Lucterios.  If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import unicode_literals
 from shutil import rmtree
+from django.db import transaction
+from django.db.models import Q, F
+from django.db.utils import IntegrityError
+from django.core.signals import request_started
 
 
 from lucterios.framework.test import LucteriosTest
+from lucterios.framework.auditlog import LucteriosAuditlogModelRegistry
+from lucterios.framework.models import LucteriosLogEntry
 from lucterios.framework.filetools import get_user_dir
 from lucterios.framework.model_fields import LucteriosScheduler
 from lucterios.contacts.test_tools import change_ourdetail
@@ -39,7 +45,7 @@ from lucterios.contacts.views_contacts import IndividualList
 from lucterios.contacts.models import CustomField
 from lucterios.contacts.views import CustomFieldAddModify, CustomFieldDel
 
-from diacamma.accounting.models import EntryAccount, FiscalYear, Third, AccountThird
+from diacamma.accounting.models import EntryAccount, EntryLineAccount, FiscalYear, Third, AccountThird, ChartsAccount
 from diacamma.accounting.views import ThirdShow, ThirdList, AccountThirdAddModify
 from diacamma.accounting.views_entries import EntryAccountList
 from diacamma.accounting.views_accounts import FiscalYearClose, FiscalYearBegin, FiscalYearReportLastYear
@@ -54,7 +60,8 @@ from diacamma.payoff.views import PayableShow, PayableEmail, PayoffAddModify
 from diacamma.payoff.views_conf import paramchange_payoff
 from diacamma.payoff.test_tools import default_bankaccount_fr, default_paymentmethod, PaymentTest, default_bankaccount_be
 
-from diacamma.condominium.models import PropertyLot, Set, Owner, CallFunds, PropertyLotCustomField
+from diacamma.condominium.models import PropertyLot, Set, Owner, CallFunds, PropertyLotCustomField, Partition, OwnerBalance, get_account_ids, \
+    DEFAULT_ACCOUNT_ALL, DEFAULT_ACCOUNT_CURRENT, LIST_DEFAULT_ACCOUNTS
 from diacamma.condominium.views import OwnerAndPropertyLotList, OwnerAdd, OwnerDel, OwnerShow, PropertyLotAddModify, CondominiumConvert, PaymentVentilatePay, \
     OwnerLoadCount, PaymentMultiPay, OwnerPayableEmail, OwnerModify, PaymentRefund, \
     OwnerReport, OwnerAndPropertyLotPrint, PropertyLotImport
@@ -630,6 +637,57 @@ class SetOwnerTest(LucteriosTest):
         self.assert_json_equal('', 'owner/@2/third', 'Rantanplan')
         self.assert_json_equal('', 'owner/@2/property_part', [125, 405, 30.86])
 
+    def test_import_propertylot_failure(self):
+        default_setowner_fr()
+        csv_content = """N°;general;sub;description;propriétaire
+4;15;10;Cave 1;Minimum
+5
+"""
+        self.factory.xfer = PropertyLotImport()
+        self.calljson('/diacamma.condominium/propertyLotImport', {"modelname": "condominium.PropertyLot", 'step': 4, 'quotechar': "'", 'delimiter': ';',
+                                                                  'encoding': 'utf-8', 'dateformat': '%d/%m/%Y', 'importcontent0': csv_content,
+                                                                  "fld_num": "N°", "fld_value": "general", "fld_custom_1": "sub",
+                                                                  "fld_description": "description", "fld_owner": "propriétaire"}, False)
+        self.assert_observer('core.exception', 'diacamma.condominium', 'propertyLotImport')
+        self.assertFalse(PropertyLot.is_import_mode())
+
+        self.factory.xfer = PropertyLotAddModify()
+        self.calljson('/diacamma.condominium/propertyLotAddModify',
+                      {'SAVE': 'YES', 'propertylot': 1, "num": "1", "value": 55, "description": 'Appart A', 'owner': 1, 'custom_1': 50}, False)
+        self.assert_observer('core.acknowledge', 'diacamma.condominium', 'propertyLotAddModify')
+        self.assertEqual(50, PropertyLotCustomField.objects.get(property_id=1, field_id=1).value)
+        self.assertEqual(55, Partition.objects.get(set_id=1, owner_id=1).value)
+
+    def test_import_propertylot_custom_values(self):
+        default_setowner_fr()
+        csv_content = """N°;general;sub;description;propriétaire
+4;15;12.0;Cave 1;Minimum
+5;15;;Cave 2;Minimum
+"""
+        self.factory.xfer = PropertyLotImport()
+        self.calljson('/diacamma.condominium/propertyLotImport', {"modelname": "condominium.PropertyLot", 'step': 4, 'quotechar': "'", 'delimiter': ';',
+                                                                  'encoding': 'utf-8', 'dateformat': '%d/%m/%Y', 'importcontent0': csv_content,
+                                                                  "fld_num": "N°", "fld_value": "general", "fld_custom_1": "sub",
+                                                                  "fld_description": "description", "fld_owner": "propriétaire"}, False)
+        self.assert_observer('core.custom', 'diacamma.condominium', 'propertyLotImport')
+        self.assert_json_equal('LABELFORM', 'result', "2 éléments ont été importés")
+        self.assertFalse(PropertyLot.is_import_mode())
+        self.assertEqual(12, PropertyLotCustomField.objects.get(property__num=4, field_id=1).value)
+        self.assertEqual(0, PropertyLotCustomField.objects.get(property__num=5, field_id=1).value)
+
+    def test_propertylot_ratio(self):
+        default_setowner_fr()
+        PropertyLot.objects.filter(id=1).update(value=F('value') + 100)
+        total_part = PropertyLot.get_total_part()
+        nb_values = 0
+        for lot in PropertyLot.objects.with_ratios():
+            self.assertEqual(total_part, lot.total_part_value)
+            self.assertAlmostEqual(100.0 * lot.value / total_part, lot.get_ratio(), delta=0.0001)
+            for ccf_model in lot.propertylotcustomfield_set.all():
+                self.assertEqual(PropertyLotCustomField.get_total_part(ccf_model.field_id), ccf_model.field_total_part)
+                nb_values += 1
+        self.assertGreater(nb_values, 0)
+
     def test_show_partition(self):
         self.factory.xfer = OwnerAndPropertyLotList()
         self.calljson('/diacamma.condominium/ownerAndPropertyLotList', {}, False)
@@ -692,6 +750,35 @@ class SetOwnerTest(LucteriosTest):
         self.assert_observer('core.custom', 'diacamma.condominium', 'ownerAndPropertyLotList')
         self.assert_count_equal('owner', 2)
 
+    def test_partition_auditlog(self):
+        LucteriosAuditlogModelRegistry.set_state_packages(['condominium'])
+        try:
+            self.factory.xfer = OwnerAdd()
+            self.calljson('/diacamma.condominium/ownerAdd', {'SAVE': 'YES', "third": 4}, False)
+            self.assert_observer('core.acknowledge', 'diacamma.condominium', 'ownerAdd')
+            self.factory.xfer = OwnerAdd()
+            self.calljson('/diacamma.condominium/ownerAdd', {'SAVE': 'YES', "third": 5}, False)
+            self.assert_observer('core.acknowledge', 'diacamma.condominium', 'ownerAdd')
+            self.factory.xfer = SetAddModify()
+            self.calljson('/diacamma.condominium/setAddModify', {'SAVE': 'YES', "name": "AAA"}, False)
+            self.assert_observer('core.acknowledge', 'diacamma.condominium', 'setAddModify')
+            lot_values = {}
+            for owner in Owner.objects.all():
+                lot_values[owner.id] = 10 * owner.id
+                PropertyLot.objects.create(num=owner.id, value=lot_values[owner.id], owner=owner)
+            set_item = Set.objects.get(name="AAA")
+            set_item.is_link_to_lots = True
+            set_item.save()
+            set_item.set_of_lots.set(PropertyLot.objects.all())
+            set_item.refresh_ratio_link_lots()
+        finally:
+            LucteriosAuditlogModelRegistry.set_state_packages([])
+        self.assertEqual(2, Partition.objects.count())
+        for partition in Partition.objects.all():
+            self.assertEqual(lot_values[partition.owner_id], partition.value)
+            self.assertEqual(1, LucteriosLogEntry.objects.filter(modelname=Partition.get_long_name(), object_id=partition.id, action=LucteriosLogEntry.Action.CREATE).count())
+            self.assertEqual(1, LucteriosLogEntry.objects.filter(modelname=Partition.get_long_name(), object_id=partition.id, action=LucteriosLogEntry.Action.UPDATE).count())
+
     def test_modify_owner(self):
         self.factory.xfer = OwnerAdd()
         self.calljson('/diacamma.condominium/ownerAdd', {'SAVE': 'YES', "third": 4}, False)
@@ -1670,6 +1757,72 @@ class OwnerTest(PaymentTest):
         self.assert_json_equal('', 'entryline/@29/entry_account', "[4505 Dalton William]")
         self.assert_json_equal('', 'entryline/@29/credit', 0.40)
 
+    def _check_owner_balances(self):
+        journal_classes = [item[0] for item in OwnerBalance.LIST_JOURNALS]
+        for third_id in Owner.objects.values_list('third_id', flat=True):
+            for year_id in FiscalYear.objects.values_list('id', flat=True):
+                for owner_type in (DEFAULT_ACCOUNT_ALL,) + LIST_DEFAULT_ACCOUNTS:
+                    stored_amount = OwnerBalance.get_amount(third_id, Q(id=year_id), owner_type, journal_classes)
+                    OwnerBalance.refresh(third_id, year_id)
+                    computed_amount = OwnerBalance.get_amount(third_id, Q(id=year_id), owner_type, journal_classes)
+                    self.assertAlmostEqual(computed_amount, stored_amount, delta=0.0001, msg="third=%s year=%s type=%s" % (third_id, year_id, owner_type))
+
+    def test_owner_balance(self):
+        add_test_callfunds(False, True)
+        add_test_expenses_fr(False, True)
+        init_compta()
+        year = FiscalYear.get_current()
+        owner = Owner.objects.get(id=1)
+        self._check_owner_balances()
+        current_amount = OwnerBalance.get_amount(owner.third_id, Q(id=year.id), DEFAULT_ACCOUNT_CURRENT, [OwnerBalance.JOURNAL_OTHER])
+
+        new_entry = EntryAccount.objects.create(year=year, journal_id=2, date_value='2015-07-01', designation='regularization')
+        EntryLineAccount.objects.create(entry=new_entry, account=ChartsAccount.get_account('4501', year), amount=35.0, third_id=owner.third_id)
+        EntryLineAccount.objects.create(entry=new_entry, account=ChartsAccount.get_account('701', year), amount=-35.0)
+        self.assertAlmostEqual(current_amount + 35.0, OwnerBalance.get_amount(owner.third_id, Q(id=year.id), DEFAULT_ACCOUNT_CURRENT, [OwnerBalance.JOURNAL_OTHER]), delta=0.0001)
+        self._check_owner_balances()
+
+        new_entry.delete()
+        self.assertAlmostEqual(current_amount, OwnerBalance.get_amount(owner.third_id, Q(id=year.id), DEFAULT_ACCOUNT_CURRENT, [OwnerBalance.JOURNAL_OTHER]), delta=0.0001)
+        self._check_owner_balances()
+
+        self.factory.xfer = FiscalYearBegin()
+        self.calljson('/diacamma.accounting/fiscalYearBegin', {'CONFIRME': 'YES', 'year': '1'}, False)
+        self.assert_observer('core.acknowledge', 'diacamma.accounting', 'fiscalYearBegin')
+        FiscalYear.objects.create(begin='2016-01-01', end='2016-12-31', status=0, last_fiscalyear_id=1)
+        for entry in EntryAccount.objects.filter(year_id=1, close=False):
+            entry.closed()
+        self._check_owner_balances()
+        self.factory.xfer = FiscalYearClose()
+        self.calljson('/diacamma.accounting/fiscalYearClose',
+                      {'year': '1', 'type_of_account': '-1', 'CONFIRME': 'YES', 'ventilate': 0}, False)
+        self.assert_observer('core.acknowledge', 'diacamma.accounting', 'fiscalYearClose')
+        self._check_owner_balances()
+
+    def test_owner_balance_refresh(self):
+        add_test_callfunds(False, True)
+        init_compta()
+        year = FiscalYear.get_current()
+        owner = Owner.objects.get(id=1)
+        nb_buckets = OwnerBalance.objects.filter(third_id=owner.third_id, year=year).count()
+        self.assertEqual(nb_buckets, (len(LIST_DEFAULT_ACCOUNTS) + 1) * len(OwnerBalance.LIST_JOURNALS))
+        current_amount = OwnerBalance.get_amount(owner.third_id, Q(id=year.id), DEFAULT_ACCOUNT_CURRENT, [item[0] for item in OwnerBalance.LIST_JOURNALS])
+        OwnerBalance.refresh(owner.third_id, year.id)
+        OwnerBalance.refresh(owner.third_id, year.id)
+        self.assertEqual(OwnerBalance.objects.filter(third_id=owner.third_id, year=year).count(), nb_buckets)
+        self.assertAlmostEqual(current_amount, OwnerBalance.get_amount(owner.third_id, Q(id=year.id), DEFAULT_ACCOUNT_CURRENT, [item[0] for item in OwnerBalance.LIST_JOURNALS]), delta=0.0001)
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                OwnerBalance.objects.create(third_id=owner.third_id, year=year, owner_type=DEFAULT_ACCOUNT_CURRENT, journal_class=OwnerBalance.JOURNAL_OTHER, amount=10.0)
+
+    def test_account_ids_per_request(self):
+        year = FiscalYear.get_current()
+        account_ids = get_account_ids('^4509', year)
+        ChartsAccount.objects.bulk_create([ChartsAccount(year=year, code='4509', name='other owner', type_of_account=ChartsAccount.TYPE_ASSET)])
+        self.assertEqual(account_ids, get_account_ids('^4509', year))
+        request_started.send(sender=self.__class__)
+        self.assertEqual(len(account_ids) + 1, len(get_account_ids('^4509', year)))
+
     def test_close_year_reserve(self):
         add_test_callfunds(False, True)
         add_test_expenses_fr(False, True)
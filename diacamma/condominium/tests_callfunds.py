@@ -22,27 +22,44 @@ along with Lucterios.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
 from __future__ import unicode_literals
+import json
+import re
 from shutil import rmtree
-
-from lucterios.framework.test import LucteriosTest
+from decimal import Decimal
+from datetime import timedelta
+from subprocess import Popen
+from sys import executable
+from socket import gethostname
+
+from django.db.models import Q, F
+from django.utils import timezone
+
+from lucterios.framework.test import LucteriosTest, AsychronousLucteriosTest
+from lucterios.framework.error import LucteriosException
+from lucterios.framework.auditlog import LucteriosAuditlogModelRegistry
+from lucterios.framework.models import LucteriosLogEntry
 from lucterios.framework.filetools import get_user_dir
 from lucterios.framework.model_fields import LucteriosScheduler
 from lucterios.CORE.models import Parameter
 from lucterios.CORE.parameters import Params
+from lucterios.documents.models import DocumentContainer
 
 from lucterios.mailing.test_tools import decode_b64
 from lucterios.mailing.models import Message
 
 from diacamma.accounting.models import ChartsAccount, FiscalYear, Budget
+from diacamma.accounting.tools import currency_round
 from diacamma.accounting.views_entries import EntryAccountList
 from diacamma.accounting.test_tools import initial_thirds_fr, default_compta_fr, default_costaccounting, initial_thirds_be, default_compta_be
 from diacamma.payoff.views import PayoffAddModify, PayableEmail
 from diacamma.payoff.test_tools import default_bankaccount_fr, default_bankaccount_be, check_pdfreport
 from diacamma.condominium.views_callfunds import CallFundsList, CallFundsAddModify, CallFundsDel, \
-    CallFundsShow, CallDetailAddModify, CallFundsTransition, CallFundsPrint, CallFundsAddCurrent, CallFundsPayableEmail
+    CallFundsShow, CallDetailAddModify, CallFundsTransition, CallFundsPrint, CallFundsAddCurrent, CallFundsPayableEmail, \
+    CallFundsJobRetry, CallFundsJobDel
 from diacamma.condominium.test_tools import default_setowner_fr, old_accounting, default_setowner_be, add_test_callfunds, \
     clear_cache
-from diacamma.condominium.models import Set, CallFunds
+from diacamma.condominium.models import Set, CallFunds, CallDetail, CallFundsJob, run_callfunds_jobs, render_callfunds_pdfreport
+from diacamma.condominium.tools import ventilate_amount
 from diacamma.condominium.views import PaymentVentilatePay, OwnerShow
 
 
@@ -847,6 +864,204 @@ class CallFundsTest(LucteriosTest):
         self.assertEqual(0.00, ChartsAccount.get_current_total_from_code('512'), '512')
         self.assertEqual(-100.00, ChartsAccount.get_current_total_from_code('531'), '531')
 
+    def test_valid_background(self):
+        self.factory.xfer = CallFundsAddModify()
+        self.calljson('/diacamma.condominium/callFundsAddModify', {'SAVE': 'YES', "date": '2015-06-10', "comment": 'abc 123'}, False)
+        self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callFundsAddModify')
+        self.factory.xfer = CallDetailAddModify()
+        self.calljson('/diacamma.condominium/callDetailAddModify', {'SAVE': 'YES', 'callfunds': 1, "type_call": 0, 'set': 1, 'price': '250.00', 'comment': 'set 1'}, False)
+        self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callDetailAddModify')
+
+        with self.settings(DIACAMMA_CALLFUNDS_BACKGROUND=True):
+            self.factory.xfer = CallFundsTransition()
+            self.calljson('/diacamma.condominium/callFundsTransition', {'CONFIRME': 'YES', 'callfunds': 1, 'TRANSITION': 'valid'}, False)
+            self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callFundsTransition')
+
+        self.assertEqual(-250.00, ChartsAccount.get_current_total_from_code('4501'), '4501')
+        self.assertEqual(1, CallFundsJob.objects.count())
+        job_item = CallFundsJob.objects.first()
+        self.assertEqual(CallFundsJob.STATUS_WAITING, job_item.status)
+        self.assertEqual(3, len(job_item.callfunds_ids))
+        self.assertEqual(0, DocumentContainer.objects.filter(metadata__startswith='CallFundsSupporting-').count())
+
+        self.factory.xfer = CallFundsList()
+        self.calljson('/diacamma.condominium/callFundsList', {'status_filter': 1}, False)
+        self.assert_observer('core.custom', 'diacamma.condominium', 'callFundsList')
+        self.assert_count_equal('callfunds', 3)
+        self.assert_json_equal('LABELFORM', 'callfundsjob_%d' % job_item.id, 'Background processing of call of funds #1: 0/%d' % job_item.get_total())
+
+        run_callfunds_jobs()
+        job_item = CallFundsJob.objects.first()
+        self.assertEqual(CallFundsJob.STATUS_DONE, job_item.status)
+        self.assertEqual(job_item.get_total(), job_item.progress)
+        for callfunds in CallFunds.objects.filter(num=1):
+            self.assertEqual(1, DocumentContainer.objects.filter(metadata='CallFundsSupporting-%d' % callfunds.supporting_id).count())
+
+        self.factory.xfer = CallFundsList()
+        self.calljson('/diacamma.condominium/callFundsList', {'status_filter': 1}, False)
+        self.assert_observer('core.custom', 'diacamma.condominium', 'callFundsList')
+        self.assertFalse('callfundsjob_%d' % job_item.id in self.json_data.keys())
+
+    def test_valid_background_failure(self):
+        self.factory.xfer = CallFundsAddModify()
+        self.calljson('/diacamma.condominium/callFundsAddModify', {'SAVE': 'YES', "date": '2015-06-10', "comment": 'abc 123'}, False)
+        self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callFundsAddModify')
+        self.factory.xfer = CallDetailAddModify()
+        self.calljson('/diacamma.condominium/callDetailAddModify', {'SAVE': 'YES', 'callfunds': 1, "type_call": 0, 'set': 1, 'price': '250.00', 'comment': 'set 1'}, False)
+        self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callDetailAddModify')
+        with self.settings(DIACAMMA_CALLFUNDS_BACKGROUND=True):
+            self.factory.xfer = CallFundsTransition()
+            self.calljson('/diacamma.condominium/callFundsTransition', {'CONFIRME': 'YES', 'callfunds': 1, 'TRANSITION': 'valid'}, False)
+            self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callFundsTransition')
+
+        job_item = CallFundsJob.objects.first()
+        other_job_item = CallFundsJob.objects.get(id=job_item.id)
+        self.assertTrue(job_item.claim())
+        self.assertFalse(other_job_item.claim())
+        self.assertEqual(0, CallFundsJob.get_pending().count())
+        other_job_item.run()
+        self.assertEqual(0, CallFundsJob.objects.get(id=job_item.id).progress)
+
+        CallFundsJob.objects.filter(id=job_item.id).update(status=CallFundsJob.STATUS_FAILURE, error='no more memory')
+        self.factory.xfer = CallFundsList()
+        self.calljson('/diacamma.condominium/callFundsList', {'status_filter': 1}, False)
+        self.assert_observer('core.custom', 'diacamma.condominium', 'callFundsList')
+        self.assert_json_equal('LABELFORM', 'callfundsjob_%d' % job_item.id, 'Failure of background processing of call of funds #1: 0/%d: no more memory' % job_item.get_total())
+        self.assertTrue('callfundsjob_retry_%d' % job_item.id in self.json_data.keys())
+        self.assertTrue('callfundsjob_del_%d' % job_item.id in self.json_data.keys())
+
+        self.factory.xfer = CallFundsJobRetry()
+        self.calljson('/diacamma.condominium/callFundsJobRetry', {'callfundsjob': job_item.id}, False)
+        self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callFundsJobRetry')
+        self.assertEqual(1, CallFundsJob.get_pending().count())
+        run_callfunds_jobs()
+        job_item = CallFundsJob.objects.get(id=job_item.id)
+        self.assertEqual(CallFundsJob.STATUS_DONE, job_item.status)
+        self.assertEqual(job_item.get_total(), job_item.progress)
+
+        self.factory.xfer = CallFundsJobDel()
+        self.calljson('/diacamma.condominium/callFundsJobDel', {'CONFIRME': 'YES', 'callfundsjob': job_item.id}, False)
+        self.assert_observer('core.exception', 'diacamma.condominium', 'callFundsJobDel')
+        CallFundsJob.objects.filter(id=job_item.id).update(status=CallFundsJob.STATUS_FAILURE)
+        self.factory.xfer = CallFundsJobDel()
+        self.calljson('/diacamma.condominium/callFundsJobDel', {'CONFIRME': 'YES', 'callfundsjob': job_item.id}, False)
+        self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callFundsJobDel')
+        self.assertEqual(0, CallFundsJob.objects.count())
+
+    def test_valid_background_crash(self):
+        self.factory.xfer = CallFundsAddModify()
+        self.calljson('/diacamma.condominium/callFundsAddModify', {'SAVE': 'YES', "date": '2015-06-10', "comment": 'abc 123'}, False)
+        self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callFundsAddModify')
+        self.factory.xfer = CallDetailAddModify()
+        self.calljson('/diacamma.condominium/callDetailAddModify', {'SAVE': 'YES', 'callfunds': 1, "type_call": 0, 'set': 1, 'price': '250.00', 'comment': 'set 1'}, False)
+        self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callDetailAddModify')
+        with self.settings(DIACAMMA_CALLFUNDS_BACKGROUND=True):
+            self.factory.xfer = CallFundsTransition()
+            self.calljson('/diacamma.condominium/callFundsTransition', {'CONFIRME': 'YES', 'callfunds': 1, 'TRANSITION': 'valid'}, False)
+            self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callFundsTransition')
+
+        job_item = CallFundsJob.objects.first()
+        self.assertTrue(job_item.claim())
+        self.assertFalse(job_item.is_stale())
+        self.assertEqual(0, CallFundsJob.requeue_stale())
+        self.assertNotEqual('', job_item.can_delete())
+        with self.assertRaises(LucteriosException):
+            job_item.retry()
+
+        dead_worker = Popen([executable, '-c', 'pass'])
+        dead_worker.wait()
+        CallFundsJob.objects.filter(id=job_item.id).update(worker="%s:%d" % (gethostname(), dead_worker.pid))
+        self.factory.xfer = CallFundsList()
+        self.calljson('/diacamma.condominium/callFundsList', {'status_filter': 1}, False)
+        self.assert_observer('core.custom', 'diacamma.condominium', 'callFundsList')
+        self.assert_json_equal('LABELFORM', 'callfundsjob_%d' % job_item.id, 'Interrupted background processing of call of funds #1: 0/%d' % job_item.get_total())
+        self.assertTrue('callfundsjob_retry_%d' % job_item.id in self.json_data.keys())
+        self.assertTrue('callfundsjob_del_%d' % job_item.id in self.json_data.keys())
+        self.assertEqual(1, CallFundsJob.requeue_stale())
+        self.assertEqual(1, CallFundsJob.get_pending().count())
+
+        job_item = CallFundsJob.objects.get(id=job_item.id)
+        self.assertTrue(job_item.claim())
+        CallFundsJob.objects.filter(id=job_item.id).update(claim_date=timezone.now() - timedelta(days=1))
+        self.factory.xfer = CallFundsJobRetry()
+        self.calljson('/diacamma.condominium/callFundsJobRetry', {'callfundsjob': job_item.id}, False)
+        self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callFundsJobRetry')
+        self.assertEqual(1, CallFundsJob.get_pending().count())
+        run_callfunds_jobs()
+        job_item = CallFundsJob.objects.get(id=job_item.id)
+        self.assertEqual(CallFundsJob.STATUS_DONE, job_item.status)
+        self.assertEqual(job_item.get_total(), job_item.progress)
+
+    def test_valid_auditlog(self):
+        LucteriosAuditlogModelRegistry.set_state_packages(['condominium'])
+        try:
+            self.factory.xfer = CallFundsAddModify()
+            self.calljson('/diacamma.condominium/callFundsAddModify', {'SAVE': 'YES', "date": '2015-06-10', "comment": 'abc 123'}, False)
+            self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callFundsAddModify')
+            self.factory.xfer = CallDetailAddModify()
+            self.calljson('/diacamma.condominium/callDetailAddModify', {'SAVE': 'YES', 'callfunds': 1, "type_call": 0, 'set': 1, 'price': '250.00', 'comment': 'set 1'}, False)
+            self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callDetailAddModify')
+            self.factory.xfer = CallFundsTransition()
+            self.calljson('/diacamma.condominium/callFundsTransition', {'CONFIRME': 'YES', 'callfunds': 1, 'TRANSITION': 'valid'}, False)
+            self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callFundsTransition')
+        finally:
+            LucteriosAuditlogModelRegistry.set_state_packages([])
+        self.assertEqual(3, CallFunds.objects.filter(num=1).count())
+        for callfunds in CallFunds.objects.filter(num=1):
+            log_entry = LucteriosLogEntry.objects.filter(modelname=CallFunds.get_long_name(), object_id=callfunds.id).first()
+            self.assertIsNotNone(log_entry)
+            additional_data = json.loads(log_entry.additional_data)
+            self.assertEqual([callfunds.calldetail_set.count()], [len(additional_data[key][str(LucteriosLogEntry.Action.ADD)]) for key in additional_data.keys()])
+
+    def test_devalid_auditlog(self):
+        self.factory.xfer = CallFundsAddModify()
+        self.calljson('/diacamma.condominium/callFundsAddModify', {'SAVE': 'YES', "date": '2015-06-10', "comment": 'abc 123'}, False)
+        self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callFundsAddModify')
+        self.factory.xfer = CallDetailAddModify()
+        self.calljson('/diacamma.condominium/callDetailAddModify', {'SAVE': 'YES', 'callfunds': 1, "type_call": 0, 'set': 1, 'price': '250.00', 'comment': 'set 1'}, False)
+        self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callDetailAddModify')
+        self.factory.xfer = CallFundsTransition()
+        self.calljson('/diacamma.condominium/callFundsTransition', {'CONFIRME': 'YES', 'callfunds': 1, 'TRANSITION': 'valid'}, False)
+        self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callFundsTransition')
+        LucteriosAuditlogModelRegistry.set_state_packages(['condominium'])
+        try:
+            self.factory.xfer = CallFundsDel()
+            self.calljson('/diacamma.condominium/callFundsDel', {'CONFIRME': 'YES', "callfunds": 2}, False)
+            self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callFundsDel')
+        finally:
+            LucteriosAuditlogModelRegistry.set_state_packages([])
+        callfunds = CallFunds.objects.get(num=None)
+        self.assertEqual(1, callfunds.calldetail_set.count())
+        log_entry = LucteriosLogEntry.objects.filter(modelname=CallFunds.get_long_name(), object_id=callfunds.id).first()
+        self.assertIsNotNone(log_entry)
+        additional_data = json.loads(log_entry.additional_data)
+        self.assertEqual([1], [len(additional_data[key][str(LucteriosLogEntry.Action.ADD)]) for key in additional_data.keys()])
+
+    def test_ventilate_amount(self):
+        self.assertEqual([25.0, 35.0, 40.0], ventilate_amount(100.0, [25, 35, 40]))
+        self.assertEqual([33.33, 33.33, 33.34], ventilate_amount(100.0, [1, 1, 1]))
+        self.assertEqual([0.0, 0.0, 0.01], ventilate_amount(0.01, [1, 1, 1]))
+        self.assertEqual([-33.33, -33.33, -33.34], ventilate_amount(-100.0, [1, 1, 1]))
+        self.assertEqual([0.0, 0.0, -0.01], ventilate_amount(-0.01, [1, 1, 1]))
+        self.assertEqual([0.0, 0.0], ventilate_amount(100.0, [0, 0]))
+        self.assertEqual([], ventilate_amount(100.0, []))
+
+    def test_callfunds_price_rounding(self):
+        add_test_callfunds(False, True)
+        year = FiscalYear.get_current()
+        CallDetail.objects.all().update(price=F('price') + Decimal('0.004'))
+        for callfunds in CallFunds.objects.filter(calldetail__isnull=False).distinct():
+            self.assertAlmostEqual(callfunds.get_total(), CallDetail.get_total_price(Q(callfunds=callfunds)), delta=0.0001)
+        nb_diff = 0
+        for set_item in Set.objects.all():
+            details = CallDetail.objects.filter(Q(set=set_item) & Q(callfunds__date__gte=year.begin) & Q(callfunds__date__lte=year.end))
+            if details.count() > 1:
+                prices = [float(detail.price) for detail in details]
+                self.assertAlmostEqual(sum([currency_round(price) for price in prices]), set_item.get_total_calloffund(year), delta=0.0001)
+                if abs(currency_round(sum(prices)) - set_item.get_total_calloffund(year)) > 0.001:
+                    nb_diff += 1
+        self.assertGreater(nb_diff, 0)
+
     def test_payoff_multiple(self):
         self.assertEqual(0.00, ChartsAccount.get_current_total_from_code('4501'), '4501')
         self.assertEqual(0.00, ChartsAccount.get_current_total_from_code('4502'), '4502')
@@ -1821,3 +2036,42 @@ class CallFundsTestOldAccounting(LucteriosTest):
         self.assert_count_equal('entryline', 2)
         self.assert_json_equal('', 'entryline/@0/entry_account', '[450 Minimum]')
         self.assert_json_equal('LABELFORM', 'result', [0.00, 0.00, 0.00, 100.00, 0.00])
+
+
+class CallFundsJobTest(AsychronousLucteriosTest):
+
+    def setUp(self):
+        initial_thirds_fr()
+        AsychronousLucteriosTest.setUp(self)
+        default_compta_fr(with12=False)
+        default_costaccounting()
+        default_bankaccount_fr()
+        default_setowner_fr()
+        clear_cache()
+        rmtree(get_user_dir(), True)
+
+    def test_render_pdfreports_workers(self):
+        self.factory.xfer = CallFundsAddModify()
+        self.calljson('/diacamma.condominium/callFundsAddModify', {'SAVE': 'YES', "date": '2015-06-10', "comment": 'abc 123'}, False)
+        self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callFundsAddModify')
+        self.factory.xfer = CallDetailAddModify()
+        self.calljson('/diacamma.condominium/callDetailAddModify', {'SAVE': 'YES', 'callfunds': 1, "type_call": 0, 'set': 1, 'price': '250.00', 'comment': 'set 1'}, False)
+        self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callDetailAddModify')
+        self.factory.xfer = CallFundsTransition()
+        self.calljson('/diacamma.condominium/callFundsTransition', {'CONFIRME': 'YES', 'callfunds': 1, 'TRANSITION': 'valid'}, False)
+        self.assert_observer('core.acknowledge', 'diacamma.condominium', 'callFundsTransition')
+        DocumentContainer.objects.filter(metadata__startswith='CallFundsSupporting-').delete()
+
+        callfunds_ids = list(CallFunds.objects.filter(num=1).order_by('id').values_list('id', flat=True))
+        self.assertEqual(3, len(callfunds_ids))
+        serial_reports = list(map(render_callfunds_pdfreport, callfunds_ids))
+        with self.settings(DIACAMMA_CALLFUNDS_PDF_WORKERS=3):
+            parallel_reports = list(CallFundsJob(num=1)._render_pdfreports(callfunds_ids))
+        self.assertEqual(len(serial_reports), len(parallel_reports))
+        for serial_report, parallel_report in zip(serial_reports, parallel_reports):
+            self.assertIsNotNone(serial_report)
+            self.assertIsNotNone(parallel_report)
+            self.assertEqual(serial_report[0], parallel_report[0])
+            self.assertEqual(serial_report[1], parallel_report[1])
+            self.assertEqual(re.sub(rb'/(CreationDate|ModDate)\s*\(D:[^)]*\)|/ID\s*\[[^]]*\]', b'', serial_report[2]),
+                             re.sub(rb'/(CreationDate|ModDate)\s*\(D:[^)]*\)|/ID\s*\[[^]]*\]', b'', parallel_report[2]))
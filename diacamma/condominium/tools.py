@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+'''
+tools for condominium package
+
+@author: Laurent GAY
+@organization: sd-libre.fr
+@contact: info@sd-libre.fr
+@copyright: 2015 sd-libre.fr
+@license: This file is part of Lucterios.
+
+Lucterios is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Lucterios is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Lucterios.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from __future__ import unicode_literals
+
+from diacamma.accounting.tools import currency_round
+
+
+def get_tantime_ratios(values, total=None):
+    if total is None:
+        total = sum(values)
+    total = float(total)
+    if abs(total) < 0.01:
+        return [0.0 for _value in values]
+    return [100.0 * float(value) / total for value in values]
+
+
+def ventilate_amount(amount, values, total=None, remainder_index=None):
+    amount = float(amount)
+    ratios = get_tantime_ratios(values, total)
+    shares = [currency_round(amount * ratio / 100.0) for ratio in ratios]
+    if remainder_index is None:
+        for index, ratio in enumerate(ratios):
+            if abs(ratio) > 0.0001:
+                remainder_index = index
+    if remainder_index is not None:
+        diff = amount - sum(shares)
+        if abs(diff) > 0.0001:
+            shares[remainder_index] = currency_round(shares[remainder_index] + diff)
+    return shares
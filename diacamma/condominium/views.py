@@ -60,6 +60,7 @@ class OwnerAndPropertyLotList(XferListEditor):
                 sort_ownerbis = "-"
             self.params['GRID_ORDER%owner+'] = sort_ownerbis
         items = sorted(items, key=lambda t: str(t).lower(), reverse=sort_ownerbis.startswith('-'))
+        Owner.prepare_totals(items, self.getparam('begin_date'), self.getparam('end_date'))
         return LucteriosQuerySet(model=Owner, initial=items)
 
     def fillresponse_header(self):
@@ -95,7 +96,7 @@ class OwnerAndPropertyLotList(XferListEditor):
                 lbl.set_location(grid.col, self.get_max_row() + 1)
                 self.add_component(lbl)
         self.new_tab(_("Property lots"))
-        self.fill_grid(0, PropertyLot, 'propertylot', PropertyLot.objects.select_related('owner__third', 'owner__third__contact', 'owner__third__contact__individual', 'owner__third__contact__legalentity').all())
+        self.fill_grid(0, PropertyLot, 'propertylot', PropertyLot.objects.select_related('owner__third', 'owner__third__contact', 'owner__third__contact__individual', 'owner__third__contact__legalentity').with_ratios())
         grid = self.get_components('propertylot')
         lbl = XferCompLabelForm("total_lot")
         lbl.set_location(0, 5)
@@ -498,6 +499,12 @@ class PropertyLotImport(ObjectImport):
     def get_select_models(self):
         return PropertyLot.get_select_contact_type(True)
 
+    def _fillcontent_import_result(self):
+        try:
+            ObjectImport._fillcontent_import_result(self)
+        finally:
+            PropertyLot.clear_import()
+
 
 def get_owners(request):
     contacts = []
@@ -627,7 +634,7 @@ def situation_condo(xfer):
             lab.set_location(0, row + 1, 2)
             xfer.add_component(lab)
             part_description = []
-            for part in owners[0].partition_set.filter(set__is_active=True):
+            for part in owners[0].partition_set.filter(set__is_active=True).with_total_part():
                 part_description.append("{[b]}%s{[/b]} %d (%s)" % (part.set, part.value, part.ratio))
             lab = XferCompLabelForm('part')
             lab.set_value("{[br/]}".join(part_description))
@@ -742,7 +749,8 @@ def reportlastyear_condo(xfer):
 
 @signal_and_lock.Signal.decorate('reportlastyear_after')
 def reportlastyear_after_condo(xfer):
-    Owner.ventilate_pay_all()
+    with Owner.deferred_ventilation():
+        Owner.ventilate_pay_all()
 
 
 @signal_and_lock.Signal.decorate('begin_year')
@@ -778,7 +786,8 @@ def finalizeyear_condo(xfer):
                 sel.set_location(1, row + 1)
                 xfer.add_component(sel)
         elif xfer.observer_name == "core.acknowledge":
-            Owner.ventilate_pay_all(year.begin, year.end)
+            with Owner.deferred_ventilation():
+                Owner.ventilate_pay_all(year.begin, year.end)
             for set_cost in year.setcost_set.filter(year=year, set__is_active=True, set__type_load=0):
                 if ventilate == 0:
                     current_system_condo().ventilate_costaccounting(year, set_cost.set, set_cost.cost_accounting, DEFAULT_ACCOUNT_CURRENT, Params.getvalue("condominium-current-revenue-account"))
@@ -10,13 +10,13 @@ from lucterios.framework.xferadvance import XferAddEditor
 from lucterios.framework.xferadvance import XferShowEditor
 from lucterios.framework.xferadvance import XferDelete
 from lucterios.framework.xfergraphic import XferContainerAcknowledge
-from lucterios.framework.xfercomponents import XferCompSelect
+from lucterios.framework.xfercomponents import XferCompSelect, XferCompLabelForm, XferCompButton
 from lucterios.framework.tools import FORMTYPE_NOMODAL, ActionsManage, MenuManage, FORMTYPE_REFRESH, CLOSE_NO, SELECT_SINGLE, CLOSE_YES, SELECT_MULTI
 from lucterios.framework.error import LucteriosException, IMPORTANT
 from lucterios.framework.xfersearch import get_criteria_list
 
 from diacamma.payoff.views import can_send_email, SupportingPrint
-from diacamma.condominium.models import CallFunds, CallDetail
+from diacamma.condominium.models import CallFunds, CallDetail, CallFundsJob, Owner
 from diacamma.condominium.system import current_system_condo
 from diacamma.accounting.models import FiscalYear
 
@@ -41,6 +41,29 @@ class CallFundsList(XferListEditor):
         edt.set_action(self.request, self.return_action(), modal=FORMTYPE_REFRESH, close=CLOSE_NO)
         self.add_component(edt)
         self.filter = Q(status=status_filter)
+        row = 4
+        for job_item in CallFundsJob.objects.exclude(status=CallFundsJob.STATUS_DONE):
+            lbl = XferCompLabelForm("callfundsjob_%d" % job_item.id)
+            if job_item.status == CallFundsJob.STATUS_FAILURE:
+                lbl.set_color('red')
+                lbl.set_value(_("Failure of background processing of %(job)s: %(error)s") % {'job': job_item, 'error': job_item.error})
+            elif job_item.is_stale():
+                lbl.set_color('red')
+                lbl.set_value(_("Interrupted background processing of %s") % job_item)
+            else:
+                lbl.set_value(_("Background processing of %s") % job_item)
+            lbl.set_location(0, row, 2)
+            self.add_component(lbl)
+            if job_item.can_retry():
+                btn = XferCompButton("callfundsjob_retry_%d" % job_item.id)
+                btn.set_location(2, row)
+                btn.set_action(self.request, CallFundsJobRetry.get_action(_('Retry'), short_icon='mdi:mdi-refresh'), close=CLOSE_NO, params={'callfundsjob': job_item.id})
+                self.add_component(btn)
+                btn = XferCompButton("callfundsjob_del_%d" % job_item.id)
+                btn.set_location(3, row)
+                btn.set_action(self.request, CallFundsJobDel.get_action(TITLE_DELETE, short_icon='mdi:mdi-delete-outline'), close=CLOSE_NO, params={'callfundsjob': job_item.id})
+                self.add_component(btn)
+            row += 1
 
     def fillresponse(self):
         XferListEditor.fillresponse(self)
@@ -49,6 +72,25 @@ class CallFundsList(XferListEditor):
             callfunds_grid.delete_header('supporting.total_rest_topay')
 
 
+@MenuManage.describ('condominium.add_callfunds')
+class CallFundsJobRetry(XferContainerAcknowledge):
+    short_icon = "mdi:mdi-home-import-outline"
+    model = CallFundsJob
+    field_id = 'callfundsjob'
+    caption = _("Retry background processing")
+
+    def fillresponse(self):
+        self.item.retry()
+
+
+@MenuManage.describ('condominium.add_callfunds')
+class CallFundsJobDel(XferDelete):
+    short_icon = "mdi:mdi-home-import-outline"
+    model = CallFundsJob
+    field_id = 'callfundsjob'
+    caption = _("Delete background processing")
+
+
 def CallFundsAddCurrent_cond(xfer):
     if xfer.getparam('status_filter', CallFunds.STATUS_VALID) == CallFunds.STATUS_BUILDING:
         return current_system_condo().CurrentCallFundsAdding(False)
@@ -167,7 +209,8 @@ class CallFundsDel(XferDelete):
         else:
             num_list = list(set(num_list))
             if self.confirme(_("Do you want delete calls of fonds #%s and the following ones?") % ",".join(num_list)):
-                CallFunds.devalid(min(num_list))
+                with Owner.deferred_ventilation():
+                    CallFunds.devalid(min(num_list))
 
 
 @ActionsManage.affect_transition("status", close=CLOSE_YES, multi_list=('close',))
@@ -177,6 +220,10 @@ class CallFundsTransition(XferTransition):
     model = CallFunds
     field_id = 'callfunds'
 
+    def _confirmed(self, transition):
+        with Owner.deferred_ventilation():
+            XferTransition._confirmed(self, transition)
+
 
 @ActionsManage.affect_grid(TITLE_ADD, short_icon='mdi:mdi-pencil-plus-outline', condition=lambda xfer, gridname='': xfer.item.status == CallFunds.STATUS_BUILDING)
 @ActionsManage.affect_grid(TITLE_MODIFY, short_icon='mdi:mdi-pencil-outline', unique=SELECT_SINGLE, condition=lambda xfer, gridname='': xfer.item.status == CallFunds.STATUS_BUILDING)
@@ -50,7 +50,7 @@ from diacamma.accounting.views_budget import BudgetList
 from diacamma.accounting.views_reports import CostAccountingIncomeStatement
 
 from diacamma.condominium.models import Set, Partition, ExpenseDetail, Owner, PropertyLot, SetCost, OwnerLink, \
-    RecoverableLoadRatio, PropertyLotCustomField
+    RecoverableLoadRatio, PropertyLotCustomField, OwnerBalance
 from diacamma.condominium.system import clear_system_condo, current_system_condo
 
 
@@ -159,6 +159,13 @@ class SetList(XferListEditor):
         if not self.getparam('show_inactive', False):
             self.filter = Q(is_active=True)
 
+    def get_items_from_filter(self):
+        items = XferListEditor.get_items_from_filter(self)
+        year = FiscalYear.objects.filter(is_actif=True).first()
+        if year is not None:
+            items = items.with_financials(year.begin, year.end)
+        return items
+
     def fillresponse(self):
         XferListEditor.fillresponse(self)
         chk = XferCompCheck('show_inactive')
@@ -310,8 +317,7 @@ class PartitionImport(ObjectImport):
             part.delete()
         self.import_driver.default_values = {'set': self.current_set}
         ObjectImport._fillcontent_import_result(self)
-        for owner in Owner.objects.filter(third__status=Third.STATUS_ENABLE):
-            Partition.objects.get_or_create(set=self.current_set, owner=owner)
+        Partition.provide([self.current_set.id], Owner.objects.filter(third__status=Third.STATUS_ENABLE).values_list('id', flat=True))
 
     def fillresponse(self, drivername="CSV", step=0):
         self.current_set = None
@@ -507,6 +513,8 @@ def paramchange_condominium(params):
             has_changed = True
         if has_changed:
             Params.clear()
+    if ('accounting-system' in params) or ('condominium-old-accounting' in params) or ('accounting-sizecode' in params) or any(account_item.startswith('condominium-default-owner-account') for account_item in params):
+        OwnerBalance.rebuild()
     if 'accounting-system' in params:
         clear_system_condo()
         system_condo = current_system_condo()
@@ -545,7 +553,7 @@ def conf_wizard_condominium(wizard_ident, xfer):
     elif (xfer is not None) and (wizard_ident == "condominium_lot"):
         from diacamma.condominium.views import PropertyLotImport
         xfer.add_title(_("Diacamma condominium"), _("Property lots"), _('Define the lots for each owners.'))
-        xfer.fill_grid(xfer.get_max_row(), PropertyLot, 'propertylot', PropertyLot.objects.all())
+        xfer.fill_grid(xfer.get_max_row(), PropertyLot, 'propertylot', PropertyLot.objects.with_ratios())
         lbl = XferCompLabelForm("total_lot")
         lbl.set_location(0, xfer.get_max_row() + 1)
         lbl.set_value(_("Total of general lot parts: %d") % PropertyLot.get_total_part())
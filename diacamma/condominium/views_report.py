@@ -27,6 +27,7 @@ from os.path import exists
 
 from django.utils.translation import gettext_lazy as _
 from django.db.models import Q
+from django.db.models.aggregates import Sum
 
 from lucterios.framework.filetools import get_user_path, readimage_to_base64
 from lucterios.framework.tools import MenuManage, FORMTYPE_NOMODAL, convert_date, CLOSE_NO, FORMTYPE_REFRESH, WrapAction
@@ -35,11 +36,11 @@ from lucterios.framework.xfercomponents import XferCompImage, XferCompSelect, Xf
 from lucterios.framework.xferadvance import TITLE_CLOSE, TITLE_PRINT
 from lucterios.CORE.parameters import Params
 
-from diacamma.accounting.models import FiscalYear, EntryAccount, ChartsAccount, Journal
+from diacamma.accounting.models import FiscalYear, EntryAccount, EntryLineAccount, ChartsAccount, Journal, Budget
 from diacamma.accounting.views_reports import FiscalYearReportPrint
-from diacamma.accounting.tools import current_system_account, format_with_devise
+from diacamma.accounting.tools import current_system_account, format_with_devise, correct_accounting_code
 from diacamma.accounting.tools_reports import get_spaces, convert_query_to_account, add_item_in_grid, fill_grid, add_cell_in_grid
-from diacamma.condominium.models import Set
+from diacamma.condominium.models import Set, SetCost, get_account_ids
 
 
 MenuManage.add_sub("condominium.print", "condominium", short_icon='mdi:mdi-home-analytics', caption=_("Report"), desc=_("Report of condominium"), pos=20)
@@ -101,6 +102,9 @@ class CondominiumReport(XferContainerCustom):
         self.filter = Q(entry__year=self.item)
         self.lastfilter = Q(entry__year=self.item.last_fiscalyear)
 
+    def get_account_ids(self, mask):
+        return get_account_ids(mask, [year for year in (self.item, self.item.last_fiscalyear) if year is not None])
+
     def define_gridheader(self):
         pass
 
@@ -142,7 +146,7 @@ class FinancialStatus(CondominiumReport):
         return line_idx, total1, total2
 
     def fill_body(self):
-        line__tresor, total1_tresor, total2_tresor = self.fill_part_of_grid('left', Q(account__code__regex=current_system_account().get_cash_mask()), 0, _('Tresory'))
+        line__tresor, total1_tresor, total2_tresor = self.fill_part_of_grid('left', Q(account_id__in=self.get_account_ids(current_system_account().get_cash_mask())), 0, _('Tresory'))
         line__capital, total1_capital, total2_capital = self.fill_part_of_grid('right', Q(account__type_of_account=2), 0, _('Provision and advance'))
         line_idx = max(line__tresor, line__capital)
         add_item_in_grid(self.grid, line_idx, 'left', (_('total'), total1_tresor, total2_tresor, None), get_spaces(5) + "{[u]}%s{[/u]}")
@@ -160,7 +164,7 @@ class FinancialStatus(CondominiumReport):
                 last_ids.append(EntryAccount.objects.filter(year=self.item.last_fiscalyear).order_by('-id')[0].id)
             except IndexError:
                 last_ids.append(0)
-        current_filter = Q(account__type_of_account__in=(ChartsAccount.TYPE_ASSET, ChartsAccount.TYPE_LIABILITY)) & ~Q(account__code__regex=current_system_account().get_cash_mask())
+        current_filter = Q(account__type_of_account__in=(ChartsAccount.TYPE_ASSET, ChartsAccount.TYPE_LIABILITY)) & ~Q(account_id__in=self.get_account_ids(current_system_account().get_cash_mask()))
         current_filter &= (~Q(entry__year__status=2) | ~(Q(entry__journal=Journal.DEFAULT_OTHER) & Q(entry__id__in=tuple(last_ids))))
         line__creance, total1_creance, total2_creance = self.fill_part_of_grid('left', current_filter, line_idx + 2, _('Créance'), sign_value=-1, with_third=True)
         line__dette, total1_dette, total2_dette = self.fill_part_of_grid('right', current_filter, line_idx + 2, _('Dettes'), sign_value=1, with_third=True)
@@ -211,6 +215,9 @@ class ManageAccounting(CondominiumReport):
 
     def fill_part_of_grid(self, current_filter, query_budget, index_begin, title, sign_value=None):
         data_line, total1, total2, totalb, _account_codes = convert_query_to_account(self.filter & current_filter, self.lastfilter & current_filter, query_budget=query_budget, sign_value=sign_value)
+        return self.fill_data_of_grid(data_line, total1, total2, totalb, index_begin, title)
+
+    def fill_data_of_grid(self, data_line, total1, total2, totalb, index_begin, title):
         add_cell_in_grid(self.grid, index_begin, 'design', get_spaces(5) + '{[u]}%s{[/u]}' % title)
         line_idx = index_begin + 1
         for data_item in data_line:
@@ -278,37 +285,113 @@ class GeneralManageAccounting(ManageAccounting):
 class CurrentManageAccounting(ManageAccounting):
     caption = _("Current manage accounting")
 
+    def _get_costaccountings(self):
+        years = [year for year in (self.item, self.next_year, self.next_year_again) if year is not None]
+        costaccountings = {}
+        for setcost in SetCost.objects.filter(year__in=years, set__type_load=Set.TYPELOAD_CURRENT, set__is_active=True).select_related('cost_accounting').order_by('id'):
+            costaccountings.setdefault((setcost.set_id, setcost.year_id), setcost.cost_accounting)
+        return costaccountings
+
+    def _get_entry_values(self, year, costaccounting_ids, account_query):
+        entry_values = {}
+        if year is None:
+            return entry_values
+        costaccounting_query = Q(costaccounting_id__in=[costaccounting_id for costaccounting_id in costaccounting_ids if costaccounting_id is not None])
+        if None in costaccounting_ids:
+            costaccounting_query |= Q(costaccounting__isnull=True)
+        entry_lines = EntryLineAccount.objects.filter(Q(entry__year=year) & costaccounting_query & account_query)
+        for data_line in entry_lines.order_by().values('costaccounting_id', 'account_id').annotate(data_sum=Sum('amount')):
+            if abs(data_line['data_sum']) > 0.001:
+                entry_values.setdefault(data_line['costaccounting_id'], []).append((data_line['account_id'], data_line['data_sum']))
+        return entry_values
+
+    def _get_budget_values(self, costaccounting_ids, revenue_account):
+        budget_values = {}
+        budgets = Budget.objects.filter(~Q(code=revenue_account) & Q(cost_accounting_id__in=costaccounting_ids))
+        for data_line in budgets.order_by().values('cost_accounting_id', 'code').annotate(data_sum=Sum('amount')):
+            if abs(data_line['data_sum']) > 0.001:
+                budget_values[(data_line['cost_accounting_id'], data_line['code'])] = data_line['data_sum']
+        return budget_values
+
     def fill_body(self):
         line_idx = 0
         total1 = 0
         total2 = 0
         totalb = [0, 0, 0]
         revenue_account = Params.getvalue("condominium-current-revenue-account")
-        initial_filter = self.filter
-        initial_lastfilter = self.lastfilter
-        for classloaditem in Set.objects.filter(type_load=0, is_active=True):
-            first_setcost = classloaditem.setcost_set.filter(year=self.item).first()
-            if first_setcost is None:
+        current_request = Q(account_id__in=self.get_account_ids(current_system_account().get_expence_mask()))
+        current_request |= Q(account_id__in=self.get_account_ids(current_system_account().get_revenue_mask())) & ~Q(account__code=revenue_account)
+        costaccountings = self._get_costaccountings()
+        set_list = []
+        for classloaditem in Set.objects.filter(type_load=Set.TYPELOAD_CURRENT, is_active=True):
+            current_costaccounting = costaccountings.get((classloaditem.id, self.item.id))
+            if current_costaccounting is None:
                 continue
-            current_costaccounting = first_setcost.cost_accounting
-            current_request = Q(account__code__regex=current_system_account().get_expence_mask())
-            current_request |= Q(account__code__regex=current_system_account().get_revenue_mask()) & ~Q(account__code=revenue_account)
-            if initial_filter is not None:
-                self.filter = initial_filter & Q(costaccounting_id=current_costaccounting.id)
-            if initial_lastfilter is not None:
-                self.lastfilter = initial_lastfilter & Q(costaccounting_id=current_costaccounting.last_costaccounting_id)
-            query_budget = [~Q(code=revenue_account) & Q(cost_accounting=current_costaccounting)]
-            if self.next_year is not None:
-                set_cost = classloaditem.setcost_set.filter(year=self.next_year).first()
-                if set_cost is None:
-                    set_cost = classloaditem.create_new_cost(year=self.next_year)
-                query_budget.append(~Q(code=revenue_account) & Q(cost_accounting=set_cost.cost_accounting))
-            if self.next_year_again is not None:
-                set_cost = classloaditem.setcost_set.filter(year=self.next_year_again).first()
-                if set_cost is None:
-                    set_cost = classloaditem.create_new_cost(year=self.next_year_again)
-                query_budget.append(~Q(code=revenue_account) & Q(cost_accounting=set_cost.cost_accounting))
-            line__current_dep, subtotal1, subtotal2, subtotalb = self.fill_part_of_grid(current_request, query_budget, line_idx, str(classloaditem), sign_value=False)
+            budget_costaccountings = [current_costaccounting]
+            for next_year in (self.next_year, self.next_year_again):
+                if next_year is not None:
+                    budget_costaccountings.append(costaccountings.get((classloaditem.id, next_year.id)))
+            set_list.append((classloaditem, current_costaccounting, [costaccounting.id if costaccounting is not None else None for costaccounting in budget_costaccountings]))
+        values_n = self._get_entry_values(self.item, [current_costaccounting.id for _classloaditem, current_costaccounting, _budget_ids in set_list], current_request)
+        values_n_1 = self._get_entry_values(self.item.last_fiscalyear, [current_costaccounting.last_costaccounting_id for _classloaditem, current_costaccounting, _budget_ids in set_list], current_request)
+        budget_values = self._get_budget_values([budget_id for _classloaditem, _current_costaccounting, budget_ids in set_list for budget_id in budget_ids if budget_id is not None], revenue_account)
+        account_ids = set()
+        for entry_values in (values_n, values_n_1):
+            for account_values in entry_values.values():
+                account_ids.update([account_id for account_id, _data_sum in account_values])
+        accounts = ChartsAccount.objects.in_bulk(list(account_ids))
+        year_accounts = list(ChartsAccount.objects.filter(year=self.item))
+        budget_ways = {}
+
+        def get_budget_way(account_code):
+            if account_code not in budget_ways:
+                budget_ways[account_code] = ChartsAccount.get_chart_account(account_code).credit_debit_way()
+            return budget_ways[account_code]
+
+        for classloaditem, current_costaccounting, budget_ids in set_list:
+            last_values = {}
+            for account_id, data_sum in values_n_1.get(current_costaccounting.last_costaccounting_id, []):
+                last_values[accounts[account_id].code] = last_values.get(accounts[account_id].code, 0) - 1 * accounts[account_id].credit_debit_way() * data_sum
+            dict_account = {}
+            subtotal1 = 0
+            subtotal2 = 0
+            subtotalb = [0 for _budget_id in budget_ids]
+            for account_id, data_sum in values_n.get(current_costaccounting.id, []):
+                account = accounts[account_id]
+                account_code = correct_accounting_code(account.code)
+                amount = -1 * account.credit_debit_way() * data_sum
+                if account_code not in dict_account:
+                    dict_account[account_code] = [account.get_name(), 0, None] + [None for _budget_id in budget_ids]
+                dict_account[account_code][1] += amount
+                subtotal1 += amount
+            for account_code, account_item in dict_account.items():
+                value2 = last_values.get(account_code, 0)
+                if abs(value2) > 0.001:
+                    account_item[2] = value2
+                subtotal2 += value2
+                for budget_idx, budget_id in enumerate(budget_ids):
+                    valueb = budget_values.get((budget_id, account_code), 0)
+                    if abs(valueb) > 0.001:
+                        account_item[budget_idx + 3] = valueb
+                    subtotalb[budget_idx] += valueb
+            account_codes = list(dict_account.keys())
+            for account in year_accounts:
+                if account.code in account_codes:
+                    continue
+                account_codes.append(account.code)
+                value2 = last_values.get(account.code, 0)
+                total_b = [-1 * get_budget_way(account.code) * budget_values[(budget_id, account.code)] if (budget_id, account.code) in budget_values else 0 for budget_id in budget_ids]
+                if (value2 != 0) or (total_b != [0 for _budget_id in budget_ids]):
+                    dict_account[account.code] = [str(account), None, None] + [0 for _budget_id in budget_ids]
+                    if abs(value2) > 0.001:
+                        dict_account[account.code][2] = value2
+                    subtotal2 += value2
+                    for budget_idx, valueb in enumerate(total_b):
+                        if abs(valueb) > 0.001:
+                            dict_account[account.code][budget_idx + 3] = valueb
+                            subtotalb[budget_idx] += valueb
+            data_line = [dict_account[account_code] for account_code in sorted(dict_account.keys())]
+            line__current_dep, subtotal1, subtotal2, subtotalb = self.fill_data_of_grid(data_line, subtotal1, subtotal2, subtotalb, line_idx, str(classloaditem))
             line_idx = line__current_dep + 1
             total1 += subtotal1
             total2 += subtotal2
@@ -352,8 +435,8 @@ class ExceptionalManageAccounting(ManageAccounting):
         totalb = [0]
         revenue_account = Params.getvalue("condominium-exceptional-revenue-account")
         for classloaditem in Set.objects.filter(type_load=1, is_active=True):
-            current_request = Q(account__code__regex=current_system_account().get_expence_mask())
-            current_request |= Q(account__code__regex=current_system_account().get_revenue_mask()) & ~Q(account__code=revenue_account)
+            current_request = Q(account_id__in=self.get_account_ids(current_system_account().get_expence_mask()))
+            current_request |= Q(account_id__in=self.get_account_ids(current_system_account().get_revenue_mask())) & ~Q(account__code=revenue_account)
             current_request &= Q(costaccounting__setcost__set=classloaditem)
             query_budget = [~Q(code=revenue_account) & Q(cost_accounting=classloaditem.current_cost_accounting) & Q(year=self.item)]
             line__current_dep, subtotal1, subtotal2, subtotalb = self.fill_part_of_grid(current_request, query_budget, line_idx, str(classloaditem), sign_value=False)